@@ -7,17 +7,34 @@ Run with:
     streamlit run app.py
 """
 
+import asyncio
+import copy
+import hashlib
+import html
+import importlib
 import io
 import json
 import logging
 import os
+import re
+import secrets
+import tempfile
+import threading
 import time
-import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 
 import streamlit as st
+from streamlit.runtime.uploaded_file_manager import UploadedFile
+
+from medecho._json import json_dumps
+
+if TYPE_CHECKING:
+    from PIL import Image
 
 # ── Page configuration (must be first Streamlit call) ─────────────────────────
 st.set_page_config(
@@ -31,277 +48,276 @@ st.set_page_config(
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("medecho.app")
 
-# ── Custom CSS ─────────────────────────────────────────────────────────────────
-CUSTOM_CSS = """
-<style>
-/* ---- Global ---- */
-:root {
-    --med-navy:    #0D1B2A;
-    --med-blue:    #1B4F72;
-    --med-teal:    #1ABC9C;
-    --med-teal2:   #17A589;
-    --med-white:   #F0F4F8;
-    --med-gray:    #BDC3C7;
-    --med-danger:  #E74C3C;
-    --med-warn:    #F39C12;
-    --med-success: #27AE60;
-    --card-bg:     #152536;
-    --border:      #1F3A52;
+# ── Cache key hashing ──────────────────────────────────────────────────────────
+# Uploads are keyed by their file_id and raw bytes by a BLAKE2b digest, rather
+# than by Streamlit's default hasher walking the whole payload.
+_HASH_FUNCS = {
+    UploadedFile: lambda f: f.file_id,
+    bytes: lambda b: hashlib.blake2b(b, digest_size=16).digest(),
 }
 
-body, .stApp {
-    background-color: var(--med-navy);
-    color: var(--med-white);
-    font-family: 'Inter', 'Segoe UI', sans-serif;
-}
+# ── Custom CSS ─────────────────────────────────────────────────────────────────
+# Styles live in app.css next to this file; the read is cached so the file is
+# loaded once per server process rather than on every rerun.
 
-/* ---- Sidebar ---- */
-[data-testid="stSidebar"] {
-    background: linear-gradient(180deg, #0a1628 0%, #0D1B2A 100%);
-    border-right: 1px solid var(--border);
-}
-[data-testid="stSidebar"] * {
-    color: var(--med-white) !important;
-}
+@st.cache_data(show_spinner=False)
+def _css() -> str:
+    css = Path(__file__).with_suffix(".css").read_text(encoding="utf-8")
+    return f"<style>\n{css.strip()}\n</style>"
 
-/* ---- Header / Logo ---- */
-.medecho-header {
-    background: linear-gradient(135deg, #0D1B2A 0%, #1B4F72 60%, #1ABC9C 100%);
-    border-radius: 16px;
-    padding: 24px 32px;
-    margin-bottom: 24px;
-    border: 1px solid var(--border);
-    box-shadow: 0 8px 32px rgba(26,188,156,0.15);
-}
-.medecho-title {
-    font-size: 2.4rem;
-    font-weight: 800;
-    letter-spacing: -0.5px;
-    color: #ffffff;
-    margin: 0;
-}
-.medecho-subtitle {
-    font-size: 1rem;
-    color: var(--med-teal);
-    margin-top: 4px;
-    letter-spacing: 0.5px;
-}
-.medecho-badge {
-    display: inline-block;
-    background: rgba(26,188,156,0.2);
-    border: 1px solid var(--med-teal);
-    border-radius: 20px;
-    padding: 2px 12px;
-    font-size: 0.75rem;
-    color: var(--med-teal);
-    margin-right: 8px;
-    margin-top: 8px;
-}
 
-/* ---- Cards ---- */
-.med-card {
-    background: var(--card-bg);
-    border: 1px solid var(--border);
-    border-radius: 12px;
-    padding: 20px 24px;
-    margin-bottom: 16px;
-}
-.med-card-title {
-    font-size: 1.1rem;
-    font-weight: 700;
-    color: var(--med-teal);
-    margin-bottom: 12px;
-    display: flex;
-    align-items: center;
-    gap: 8px;
-}
+st.markdown(_css(), unsafe_allow_html=True)
 
-/* ---- Status indicators ---- */
-.status-online  { color: var(--med-success); font-weight: 600; }
-.status-offline { color: var(--med-danger);  font-weight: 600; }
-.status-warn    { color: var(--med-warn);    font-weight: 600; }
-
-/* ---- Metric tiles ---- */
-.metric-row { display: flex; gap: 12px; flex-wrap: wrap; margin-bottom: 16px; }
-.metric-tile {
-    flex: 1; min-width: 120px;
-    background: rgba(26,188,156,0.08);
-    border: 1px solid rgba(26,188,156,0.25);
-    border-radius: 10px;
-    padding: 14px;
-    text-align: center;
-}
-.metric-tile .val { font-size: 1.8rem; font-weight: 800; color: var(--med-teal); }
-.metric-tile .lbl { font-size: 0.75rem; color: var(--med-gray); margin-top: 2px; }
-
-/* ---- Score bars ---- */
-.score-bar-wrap { margin-bottom: 8px; }
-.score-label    { font-size: 0.85rem; color: var(--med-white); display: flex; justify-content: space-between; }
-.score-bar-bg   { background: var(--border); border-radius: 4px; height: 8px; margin-top: 4px; }
-.score-bar-fill { height: 8px; border-radius: 4px; background: linear-gradient(90deg, #1ABC9C, #2ECC71); }
-
-/* ---- Redaction pills ---- */
-.redact-pill {
-    display: inline-block;
-    background: rgba(231,76,60,0.2);
-    border: 1px solid var(--med-danger);
-    border-radius: 12px;
-    padding: 2px 10px;
-    font-size: 0.75rem;
-    color: var(--med-danger);
-    margin: 2px;
-}
 
-/* ---- Tabs ---- */
-[data-testid="stTabs"] [data-baseweb="tab-list"] {
-    background: var(--card-bg);
-    border-radius: 10px;
-    padding: 4px;
-    gap: 2px;
-    border: 1px solid var(--border);
-}
-[data-testid="stTabs"] [data-baseweb="tab"] {
-    color: var(--med-gray) !important;
-    border-radius: 8px;
-    padding: 8px 20px;
-}
-[data-testid="stTabs"] [aria-selected="true"] {
-    background: var(--med-teal) !important;
-    color: white !important;
-}
+def _card_title(title: str, icon: str) -> str:
+    return f'<div class="med-card-title">{icon} {title}</div>'
 
-/* ---- Buttons ---- */
-.stButton > button {
-    background: linear-gradient(135deg, var(--med-teal), var(--med-teal2));
-    color: white;
-    border: none;
-    border-radius: 8px;
-    font-weight: 600;
-    padding: 8px 20px;
-    transition: all 0.2s;
-}
-.stButton > button:hover {
-    transform: translateY(-1px);
-    box-shadow: 0 4px 15px rgba(26,188,156,0.4);
-}
 
-/* ---- Text areas / inputs ---- */
-.stTextArea textarea, .stTextInput input {
-    background: var(--card-bg) !important;
-    color: var(--med-white) !important;
-    border: 1px solid var(--border) !important;
-    border-radius: 8px !important;
-}
-.stSelectbox select, div[data-baseweb="select"] {
-    background: var(--card-bg) !important;
-    color: var(--med-white) !important;
-}
+def _hcat(*parts: str) -> None:
+    """Emit several HTML fragments as a single element instead of one call each."""
+    st.html("".join(parts))
 
-/* ---- VAD pulse animation ---- */
-@keyframes vad-pulse {
-    0%   { box-shadow: 0 0 0 0 rgba(26,188,156, 0.7); }
-    70%  { box-shadow: 0 0 0 10px rgba(26,188,156, 0); }
-    100% { box-shadow: 0 0 0 0 rgba(26,188,156, 0); }
-}
-.vad-active {
-    display: inline-block;
-    width: 12px; height: 12px;
-    background: var(--med-teal);
-    border-radius: 50%;
-    animation: vad-pulse 1.5s infinite;
-}
 
-/* ---- Diff Dx confidence badges ---- */
-.badge-high   { background: rgba(39,174,96,0.2);  color: #2ECC71; border: 1px solid #27AE60; }
-.badge-medium { background: rgba(243,156,18,0.2); color: #F39C12; border: 1px solid #D68910; }
-.badge-low    { background: rgba(231,76,60,0.2);  color: #E74C3C; border: 1px solid #C0392B; }
-.badge-conf {
-    display: inline-block;
-    border-radius: 20px;
-    padding: 1px 10px;
-    font-size: 0.72rem;
-    font-weight: 700;
-    text-transform: uppercase;
-}
+# ── Binary blobs ───────────────────────────────────────────────────────────────
+# Audio, exports and QR images are written to a temp dir and session state keeps
+# only a small reference, since Streamlit holds session state for the whole
+# lifetime of a session. Files not read for _BLOB_TTL_S are swept on each spill.
 
-/* ---- QR box ---- */
-.qr-container {
-    background: white;
-    border-radius: 12px;
-    padding: 16px;
-    display: inline-block;
-    box-shadow: 0 4px 24px rgba(0,0,0,0.3);
-}
+_BLOB_DIR = Path(tempfile.gettempdir()) / "medecho_blobs"
+_BLOB_TTL_S = 6 * 60 * 60
 
-/* ---- Scrollable transcript ---- */
-.transcript-box {
-    background: var(--card-bg);
-    border: 1px solid var(--border);
-    border-radius: 10px;
-    padding: 16px;
-    min-height: 120px;
-    max-height: 280px;
-    overflow-y: auto;
-    font-size: 0.95rem;
-    line-height: 1.7;
-    white-space: pre-wrap;
-}
-</style>
-"""
-st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
+
+@dataclass(frozen=True)
+class _BlobRef:
+    path: str
+    size: int
+
+
+def _sweep_blobs() -> None:
+    cutoff = time.time() - _BLOB_TTL_S
+    for entry in os.scandir(_BLOB_DIR):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.unlink(entry.path)
+        except OSError:
+            pass
+
+
+def _new_blob_path() -> str:
+    """Create an empty temp file for a blob and return its path."""
+    _BLOB_DIR.mkdir(parents=True, exist_ok=True)
+    _sweep_blobs()
+    with tempfile.NamedTemporaryFile(dir=_BLOB_DIR, delete=False) as tmp:
+        return tmp.name
+
+
+def _spill(data: bytes) -> _BlobRef:
+    """Write *data* to a temp file and return a reference to it."""
+    path = _new_blob_path()
+    Path(path).write_bytes(data)
+    return _BlobRef(path=path, size=len(data))
+
+
+def _load(ref: _BlobRef) -> bytes:
+    """Read a spilled blob back; returns b"" if it has already been swept."""
+    try:
+        # Bump the mtime so _sweep_blobs only expires blobs nobody reads
+        os.utime(ref.path)
+        return Path(ref.path).read_bytes()
+    except FileNotFoundError:
+        logger.warning("Spilled blob %s no longer exists.", ref.path)
+        return b""
+
+
+def _discard(ref: _BlobRef) -> None:
+    Path(ref.path).unlink(missing_ok=True)
+
+
+def _set_blob(key: str, ref: _BlobRef) -> None:
+    """Point ``st.session_state[key]`` at *ref*, dropping any previous blob."""
+    old = st.session_state.get(key)
+    if isinstance(old, _BlobRef):
+        _discard(old)
+    st.session_state[key] = ref
+
+
+def _store_blob(key: str, data: bytes) -> None:
+    """Spill *data* into ``st.session_state[key]``, dropping any previous blob."""
+    _set_blob(key, _spill(data))
 
 
 # ── Session state initialisation ───────────────────────────────────────────────
 
+_DEFAULTS = MappingProxyType({
+    "transcript": "",
+    "redacted_transcript": "",
+    "pii_labels": [],
+    "structured_data": {},
+    "diff_dx": {},
+    "image_analysis": {},
+    "siglip_scores": [],
+    "encounter_data": {},
+    # Binary payloads are spilled to disk; session state only holds a _BlobRef
+    "qr_bytes": None,
+    "export_bytes": None,
+    "export_key": "",
+    "ehr_summary": "",
+    "offline_mode": False,
+    "connectivity_checked": False,
+    "_last_online": True,
+    "_online_probe": None,
+    "_online_checked_at": None,
+    "audio_bytes": None,
+    "_audio_file_id": None,
+    "recording": False,
+    "model_loaded": False,
+    "prior_report": "",
+    # API keys — pre-populated from environment, editable at runtime
+    "gemini_key": os.environ.get("GEMINI_API_KEY", ""),
+    "hf_token": os.environ.get("HF_TOKEN", ""),
+    "medasr_key": os.environ.get("GOOGLE_CLOUD_API_KEY", ""),
+})
+
+# Keys cleared by "New Encounter"
+_ENCOUNTER_KEYS = (
+    "transcript", "redacted_transcript", "pii_labels", "structured_data",
+    "diff_dx", "image_analysis", "siglip_scores", "encounter_data",
+    "qr_bytes", "export_bytes", "export_key", "audio_bytes", "_audio_file_id",
+)
+
+
+def _new_encounter_id() -> str:
+    return secrets.token_hex(4).upper()
+
+
+def _new_session_id() -> str:
+    # Keys the saved session file; unlike the displayed EID it can't be guessed
+    return secrets.token_urlsafe(16)
+
+
+# Encounter results written to disk so a server restart doesn't lose them.
+# The raw transcript and EHR summary are unredacted PHI, so they stay in memory.
+_PERSISTED_KEYS = (
+    "redacted_transcript", "pii_labels", "structured_data",
+    "diff_dx", "image_analysis", "siglip_scores",
+)
+_SID_RE = re.compile(r"[A-Za-z0-9_-]{22}")
+_EID_RE = re.compile(r"[0-9A-F]{8}")
+
+
 def _init_state() -> None:
-    defaults = {
-        "encounter_id": str(uuid.uuid4())[:8].upper(),
-        "transcript": "",
-        "redacted_transcript": "",
-        "pii_labels": [],
-        "structured_data": {},
-        "diff_dx": {},
-        "image_analysis": {},
-        "siglip_scores": [],
-        "encounter_data": {},
-        "qr_bytes": b"",
-        "export_bytes": b"",
-        "export_key": "",
-        "ehr_summary": "",
-        "offline_mode": False,
-        "connectivity_checked": False,
-        "audio_bytes": b"",
-        "recording": False,
-        "model_loaded": False,
-        "prior_report": "",
-        # API keys — pre-populated from environment, editable at runtime
-        "gemini_key": os.environ.get("GEMINI_API_KEY", ""),
-        "hf_token": os.environ.get("HF_TOKEN", ""),
-        "medasr_key": os.environ.get("GOOGLE_CLOUD_API_KEY", ""),
-    }
-    for k, v in defaults.items():
+    if "session_id" not in st.session_state:
+        store = _offline_mod().OfflineStore()
+        store.sweep_sessions()
+        sid = st.query_params.get("sid", "")
+        saved = (store.load_session(sid) if _SID_RE.fullmatch(sid) else None) or {}
+        eid = saved.get("encounter_id", "")
+        if _EID_RE.fullmatch(eid):
+            st.session_state.session_id = sid
+            st.session_state.encounter_id = eid
+            for k in _PERSISTED_KEYS:
+                if k in saved:
+                    st.session_state[k] = saved[k]
+        else:
+            st.session_state.session_id = _new_session_id()
+            st.session_state.encounter_id = _new_encounter_id()
+    # Keep the session ID in the URL so a page reload resumes the same encounter
+    if st.query_params.get("sid") != st.session_state.session_id:
+        st.query_params["sid"] = st.session_state.session_id
+    for k, v in _DEFAULTS.items():
         if k not in st.session_state:
-            st.session_state[k] = v
+            st.session_state[k] = copy.copy(v)
+
 
-_init_state()
+def _persist_encounter() -> None:
+    """Save the current encounter's results; called after each of them changes."""
+    state = {k: st.session_state[k] for k in _PERSISTED_KEYS}
+    state["encounter_id"] = st.session_state.encounter_id
+    _offline_mod().OfflineStore().save_session(st.session_state.session_id, state)
 
 
 # ── Connectivity check ─────────────────────────────────────────────────────────
 
-@st.cache_data(ttl=30)
+_CONNECTIVITY_TTL_S = 30.0
+
+
+@st.cache_resource
+def _probe_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="medecho-probe")
+
+
 def _check_connectivity() -> bool:
-    from medecho.offline import is_online
-    return is_online()
+    """
+    Return the last known connectivity state without blocking the UI.
+
+    The network probe runs on a background thread at most once every
+    ``_CONNECTIVITY_TTL_S`` seconds; its result is picked up on a later rerun.
+    """
+    probe = st.session_state._online_probe
+    if probe is not None and probe.done():
+        st.session_state._last_online = probe.result()
+        st.session_state._online_probe = probe = None
+
+    checked_at = st.session_state._online_checked_at
+    if probe is None and (
+        checked_at is None or time.monotonic() - checked_at >= _CONNECTIVITY_TTL_S
+    ):
+        st.session_state._online_probe = _probe_executor().submit(_offline_mod().is_online)
+        st.session_state._online_checked_at = time.monotonic()
+
+    return st.session_state._last_online
 
 
 # ── Lazy-loaded modules ────────────────────────────────────────────────────────
+# Imported on first use and held by cache_resource, so reruns never go back
+# through the import machinery.
+
+@st.cache_resource(show_spinner=False)
+def _pil():
+    from PIL import Image
+    return Image
+
+@st.cache_resource(show_spinner=False)
+def _voice_mod():
+    import medecho.voice as voice
+    return voice
+
+@st.cache_resource(show_spinner=False)
+def _offline_mod():
+    import medecho.offline as offline
+    return offline
+
+
+# Heavy ML dependencies, imported in the background at server start so the
+# first model-backed click doesn't stall on the import.
+_PREWARM_MODULES = ("torch", "transformers", "google.generativeai")
+
+
+@st.cache_resource(show_spinner=False)
+def _prewarm_imports() -> threading.Thread:
+    def _run() -> None:
+        for name in _PREWARM_MODULES:
+            try:
+                importlib.import_module(name)
+            except Exception as exc:
+                logger.debug("Prewarm import of %s skipped: %s", name, exc)
+
+    thread = threading.Thread(target=_run, name="medecho-prewarm", daemon=True)
+    thread.start()
+    return thread
+
 
 @st.cache_resource(show_spinner="Initialising PII redactor…")
 def get_redactor():
     from medecho.voice import redact_pii
     return redact_pii
 
-@st.cache_resource(show_spinner="Setting up clinical engine…")
+# Each entry can hold a multi-GB model, so only keep the most recent configs.
+@st.cache_resource(
+    max_entries=2,
+    show_spinner="Setting up clinical engine…",
+    validate=lambda engine: engine.ping(),
+)
 def get_clinical_engine(gemini_key: str, model_size: str):
     from medecho.clinical import ClinicalEngine, MedGemmaTextClient
     llm = MedGemmaTextClient(
@@ -310,7 +326,7 @@ def get_clinical_engine(gemini_key: str, model_size: str):
     )
     return ClinicalEngine(llm=llm)
 
-@st.cache_resource(show_spinner="Setting up image analyser…")
+@st.cache_resource(max_entries=2, show_spinner="Setting up image analyser…")
 def get_image_analyzer(hf_token: str, gemini_key: str):
     # Returns (MedGemmaImageAnalyzer, MedSigLIPAnalyzer)
     from medecho.imaging import MedGemmaImageAnalyzer, MedSigLIPAnalyzer
@@ -319,40 +335,71 @@ def get_image_analyzer(hf_token: str, gemini_key: str):
         MedSigLIPAnalyzer(),
     )
 
+@st.cache_resource(
+    max_entries=2,
+    show_spinner=False,
+    validate=lambda client: client.ping(),
+)
+def get_vision_client(gemini_key: str):
+    from medecho.imaging import GeminiVisionClient
+    return GeminiVisionClient(api_key=gemini_key)
+
 @st.cache_resource(show_spinner="Setting up output modules…")
-def get_exporters():
-    from medecho.output import EncryptedJSONExporter, QRCodeGenerator
-    exp = EncryptedJSONExporter()
-    qr = QRCodeGenerator()
-    return exp, qr
+def get_qr_generator():
+    from medecho.output import QRCodeGenerator
+    return QRCodeGenerator()
+
+
+def get_exporter():
+    """This session's exporter; kept in session state so each user has their own key."""
+    if "_exporter" not in st.session_state:
+        from medecho.output import EncryptedJSONExporter
+        st.session_state._exporter = EncryptedJSONExporter()
+    return st.session_state._exporter
 
 
 # ── Sidebar ────────────────────────────────────────────────────────────────────
 
-def render_sidebar() -> Dict:
-    """Render sidebar and return configuration dict."""
-    with st.sidebar:
-        st.markdown(
-            """
-            <div style='text-align:center; padding: 12px 0 20px 0;'>
-              <span style='font-size:2.5rem'>🩺</span><br>
-              <strong style='font-size:1.2rem; color:#1ABC9C;'>MedEcho</strong><br>
-              <span style='font-size:0.75rem; color:#BDC3C7;'>AI Clinical Scribe v1.0</span>
-            </div>
-            """,
-            unsafe_allow_html=True,
-        )
+_LLM_OPTIONS = ["MedGemma 4B (local)", "MedGemma 27B (local)", "Gemini 2.0 Flash (cloud)"]
+_LLM_DEFAULT_IDX = _LLM_OPTIONS.index("Gemini 2.0 Flash (cloud)")
+# Local model size per option; for Gemini this is the fallback model
+_LLM_SIZE = dict(zip(_LLM_OPTIONS, ("4b", "27b", "27b")))
 
-        # Connectivity status
-        online = _check_connectivity()
-        st.session_state.offline_mode = not online
-        icon = "🟢" if online else "🔴"
-        status = "Online" if online else "Offline Mode"
-        css = "status-online" if online else "status-offline"
-        st.markdown(f"<p class='{css}'>{icon} {status}</p>", unsafe_allow_html=True)
+_IMG_OPTIONS = ["MedGemma 4B (local)", "Gemini Vision (cloud)"]
+_IMG_DEFAULT_IDX = _IMG_OPTIONS.index("Gemini Vision (cloud)")
 
-        st.divider()
 
+def _mark_cfg_changed() -> None:
+    st.session_state._cfg_changed = True
+
+
+@st.fragment
+def render_sidebar() -> None:
+    """Render sidebar and publish the configuration dict to ``st.session_state.cfg``."""
+    st.markdown(
+        """
+        <div style='text-align:center; padding: 12px 0 20px 0;'>
+          <span style='font-size:2.5rem'>🩺</span><br>
+          <strong style='font-size:1.2rem; color:#1ABC9C;'>MedEcho</strong><br>
+          <span style='font-size:0.75rem; color:#BDC3C7;'>AI Clinical Scribe v1.0</span>
+        </div>
+        """,
+        unsafe_allow_html=True,
+    )
+
+    # Connectivity status
+    online = _check_connectivity()
+    st.session_state.offline_mode = not online
+    icon = "🟢" if online else "🔴"
+    status = "Online" if online else "Offline Mode"
+    css = "status-online" if online else "status-offline"
+    st.markdown(f"<p class='{css}'>{icon} {status}</p>", unsafe_allow_html=True)
+
+    st.divider()
+
+    # Inputs below only take effect on "Apply", so typing a key or name
+    # doesn't rerun the sidebar on every keystroke.
+    with st.form("cfg", border=False):
         # ── API Keys ────────────────────────────────────────────────
         st.subheader("🔑 API Configuration")
         if not st.session_state.gemini_key and not st.session_state.hf_token:
@@ -387,22 +434,18 @@ def render_sidebar() -> Dict:
 
         # ── Model Selection ─────────────────────────────────────────
         st.subheader("🤖 Model Settings")
-        _LLM_OPTIONS = ["MedGemma 4B (local)", "MedGemma 27B (local)", "Gemini 2.0 Flash (cloud)"]
-        _LLM_DEFAULT = "Gemini 2.0 Flash (cloud)"
         llm_choice = st.selectbox(
             "Clinical Reasoning Model",
             _LLM_OPTIONS,
-            index=_LLM_OPTIONS.index(_LLM_DEFAULT),
+            index=_LLM_DEFAULT_IDX,
             help="Select the LLM for differential diagnosis and structured extraction.",
         )
-        model_size = "4b" if "4B" in llm_choice else "27b"
+        model_size = _LLM_SIZE[llm_choice]
 
-        _IMG_OPTIONS = ["MedGemma 4B (local)", "Gemini Vision (cloud)"]
-        _IMG_DEFAULT = "Gemini Vision (cloud)"
         img_backend = st.selectbox(
             "Image Analysis Backend",
             _IMG_OPTIONS,
-            index=_IMG_OPTIONS.index(_IMG_DEFAULT),
+            index=_IMG_DEFAULT_IDX,
         )
         use_siglip = st.toggle("Enable MedSigLIP Zero-Shot", value=True)
         use_vad = st.toggle("Enable VAD (Voice Activity Detection)", value=True)
@@ -415,35 +458,39 @@ def render_sidebar() -> Dict:
         physician = st.text_input("Attending Physician", placeholder="Dr. Smith")
         encounter_date = st.date_input("Encounter Date", value=datetime.today())
 
-        st.divider()
+        applied = st.form_submit_button("Apply", use_container_width=True)
 
-        # ── Security ────────────────────────────────────────────────
-        st.subheader("🔒 Security")
-        encrypt_output = st.toggle("Encrypt Export", value=True)
-        generate_qr = st.toggle("Generate QR Code", value=True)
+    st.divider()
 
-        # ── Encounter ID ────────────────────────────────────────────
-        st.markdown(
-            f"<p style='font-size:0.8rem; color:#BDC3C7;'>Encounter ID: "
-            f"<code style='color:#1ABC9C;'>{st.session_state.encounter_id}</code></p>",
-            unsafe_allow_html=True,
-        )
+    # ── Security ────────────────────────────────────────────────
+    st.subheader("🔒 Security")
+    encrypt_output = st.toggle("Encrypt Export", value=True, on_change=_mark_cfg_changed)
+    generate_qr = st.toggle("Generate QR Code", value=True, on_change=_mark_cfg_changed)
 
-        if st.button("🔄 New Encounter"):
-            # Reset encounter-specific state
-            for k in [
-                "transcript", "redacted_transcript", "pii_labels", "structured_data",
-                "diff_dx", "image_analysis", "siglip_scores", "encounter_data",
-                "qr_bytes", "export_bytes", "export_key", "audio_bytes",
-            ]:
-                st.session_state[k] = type(st.session_state[k])()
-            st.session_state.encounter_id = str(uuid.uuid4())[:8].upper()
-            st.rerun()
+    # ── Encounter ID ────────────────────────────────────────────
+    st.markdown(
+        f"<p style='font-size:0.8rem; color:#BDC3C7;'>Encounter ID: "
+        f"<code style='color:#1ABC9C;'>{st.session_state.encounter_id}</code></p>",
+        unsafe_allow_html=True,
+    )
 
-    return {
-        "gemini_key": st.session_state.gemini_key,
-        "hf_token": st.session_state.hf_token,
-        "medasr_key": st.session_state.medasr_key,
+    if st.button("🔄 New Encounter"):
+        # Reset encounter-specific state
+        for k in _ENCOUNTER_KEYS:
+            if isinstance(st.session_state[k], _BlobRef):
+                _discard(st.session_state[k])
+            st.session_state[k] = copy.copy(_DEFAULTS[k])
+        _offline_mod().OfflineStore().delete_session(st.session_state.session_id)
+        st.session_state.session_id = _new_session_id()
+        st.session_state.encounter_id = _new_encounter_id()
+        st.query_params["sid"] = st.session_state.session_id
+        st.rerun(scope="app")
+
+    st.session_state.cfg = {
+        # Stripped so stray whitespace doesn't create extra model cache entries
+        "gemini_key": st.session_state.gemini_key.strip(),
+        "hf_token": st.session_state.hf_token.strip(),
+        "medasr_key": st.session_state.medasr_key.strip(),
         "model_size": model_size,
         "llm_choice": llm_choice,
         "img_backend": img_backend,
@@ -455,11 +502,15 @@ def render_sidebar() -> Dict:
         "encrypt_output": encrypt_output,
         "generate_qr": generate_qr,
     }
+    # Widgets here only rerun the fragment; the tabs read cfg, so rerun them too.
+    if applied or st.session_state.pop("_cfg_changed", False):
+        st.rerun(scope="app")
 
 
 # ── Header ─────────────────────────────────────────────────────────────────────
 
-def render_header(cfg: Dict) -> None:
+@st.fragment
+def render_header() -> None:
     online_badge = (
         '<span class="medecho-badge">🟢 Online</span>'
         if not st.session_state.offline_mode
@@ -486,22 +537,28 @@ def render_header(cfg: Dict) -> None:
 
 # ── Tab 1: Voice Interface ─────────────────────────────────────────────────────
 
-def render_voice_tab(cfg: Dict) -> None:
+@st.cache_data(show_spinner=False)
+def _render_pii_pills(labels: Tuple[str, ...]) -> str:
+    return " ".join(f'<span class="redact-pill">{lbl}</span>' for lbl in labels)
+
+
+@st.fragment
+def render_voice_tab() -> None:
+    cfg = st.session_state.cfg
     col_left, col_right = st.columns([1, 1], gap="large")
 
     with col_left:
-        st.markdown('<div class="med-card">', unsafe_allow_html=True)
-        st.markdown(
-            '<div class="med-card-title">🎙️ Voice Capture</div>', unsafe_allow_html=True
-        )
-
         # VAD status
         vad_html = (
             '<span class="vad-active"></span> <span style="color:#1ABC9C; font-size:0.85rem;">VAD Active</span>'
             if cfg["use_vad"]
             else '<span style="color:#BDC3C7; font-size:0.85rem;">VAD Disabled</span>'
         )
-        st.markdown(vad_html, unsafe_allow_html=True)
+        _hcat(
+            '<div class="med-card">',
+            _card_title("Voice Capture", "🎙️"),
+            vad_html,
+        )
 
         # File upload (browser microphone not available in base Streamlit)
         audio_file = st.file_uploader(
@@ -513,7 +570,9 @@ def render_voice_tab(cfg: Dict) -> None:
 
         if audio_file:
             st.audio(audio_file)
-            st.session_state.audio_bytes = audio_file.read()
+            if st.session_state._audio_file_id != audio_file.file_id:
+                _store_blob("audio_bytes", audio_file.getvalue())
+                st.session_state._audio_file_id = audio_file.file_id
 
         # Or type/paste transcript directly
         st.markdown("**— or —**")
@@ -534,25 +593,29 @@ def render_voice_tab(cfg: Dict) -> None:
             text_to_process = manual_text.strip()
 
             if not text_to_process and st.session_state.audio_bytes:
-                with st.spinner("Transcribing audio with MedASR…"):
-                    from medecho.voice import MedASRClient, VoiceActivityDetector, pcm_frames
-
-                    vad = VoiceActivityDetector() if cfg["use_vad"] else None
-                    asr = MedASRClient(
-                        api_key=cfg["medasr_key"] or None,
-                        use_local_fallback=True,
-                    )
+                voice = _voice_mod()
+                vad = voice.get_vad() if cfg["use_vad"] else None
+                asr = voice.MedASRClient(
+                    api_key=cfg["medasr_key"] or None,
+                    use_local_fallback=True,
+                )
 
-                    audio_data = st.session_state.audio_bytes
-                    if vad and vad.available:
-                        audio_data = vad.filter_speech(audio_data)
+                audio_data = _load(st.session_state.audio_bytes)
+                if vad and vad.available:
+                    audio_data = vad.filter_speech(audio_data)
 
-                    result = asr.transcribe(audio_data)
-                    text_to_process = result["text"]
-                    st.info(
-                        f"Transcription source: **{result['source']}** | "
-                        f"Confidence: **{result['confidence']:.0%}**"
-                    )
+                # Stream segments as they are recognised; each one is
+                # redacted before it reaches the page.
+                redact_fn = get_redactor()
+                st.write_stream(
+                    redact_fn(chunk)[0] for chunk in asr.transcribe_stream(audio_data)
+                )
+                result = asr.last_result
+                text_to_process = result["text"]
+                st.toast(
+                    f"Transcription source: **{result['source']}** | "
+                    f"Confidence: **{result['confidence']:.0%}**"
+                )
 
             if text_to_process:
                 # PII redaction
@@ -560,15 +623,17 @@ def render_voice_tab(cfg: Dict) -> None:
                 redacted, labels = redact_fn(text_to_process)
                 st.session_state.transcript = text_to_process
                 st.session_state.redacted_transcript = redacted
-                st.session_state.pii_labels = labels
+                st.session_state.pii_labels = list(dict.fromkeys(labels))
+                _persist_encounter()
+                # The clinical and output tabs read the transcript, so refresh
+                # the whole app rather than just this fragment.
+                st.rerun(scope="app")
             elif st.session_state.offline_mode:
                 st.warning("Offline: Audio saved locally for later processing.")
                 if st.session_state.audio_bytes:
-                    from medecho.offline import OfflineStore
-                    from medecho.voice import bytes_to_wav
-                    store = OfflineStore()
+                    store = _offline_mod().OfflineStore()
                     store.save_audio(
-                        bytes_to_wav(st.session_state.audio_bytes),
+                        _voice_mod().bytes_to_wav(_load(st.session_state.audio_bytes)),
                         encounter_id=st.session_state.encounter_id,
                     )
             else:
@@ -577,10 +642,9 @@ def render_voice_tab(cfg: Dict) -> None:
         st.markdown("</div>", unsafe_allow_html=True)
 
     with col_right:
-        st.markdown('<div class="med-card">', unsafe_allow_html=True)
-        st.markdown(
-            '<div class="med-card-title">📝 Transcript (Privacy-Protected)</div>',
-            unsafe_allow_html=True,
+        _hcat(
+            '<div class="med-card">',
+            _card_title("Transcript (Privacy-Protected)", "📝"),
         )
 
         if st.session_state.redacted_transcript:
@@ -591,11 +655,10 @@ def render_voice_tab(cfg: Dict) -> None:
 
             if st.session_state.pii_labels:
                 st.markdown("**PII Redacted:**")
-                pills = " ".join(
-                    f'<span class="redact-pill">{lbl}</span>'
-                    for lbl in set(st.session_state.pii_labels)
+                st.markdown(
+                    _render_pii_pills(tuple(st.session_state.pii_labels)),
+                    unsafe_allow_html=True,
                 )
-                st.markdown(pills, unsafe_allow_html=True)
             else:
                 st.success("✅ No PII detected")
         else:
@@ -607,7 +670,7 @@ def render_voice_tab(cfg: Dict) -> None:
         # EHR Context
         st.markdown("---")
         st.markdown(
-            '<div class="med-card-title">📋 EHR Context (Optional)</div>',
+            _card_title("EHR Context (Optional)", "📋"),
             unsafe_allow_html=True,
         )
         ehr_input = st.text_area(
@@ -619,11 +682,12 @@ def render_voice_tab(cfg: Dict) -> None:
             with st.spinner("Summarising patient history…"):
                 engine = get_clinical_engine(cfg["gemini_key"], cfg["model_size"])
                 st.session_state.ehr_summary = engine.summarize_ehr(ehr_input)
+                _persist_encounter()
             st.success("EHR summarised!")
 
         if st.session_state.ehr_summary:
             st.markdown(
-                f'<div class="transcript-box">{st.session_state.ehr_summary}</div>',
+                f'<div class="transcript-box">{html.escape(st.session_state.ehr_summary)}</div>',
                 unsafe_allow_html=True,
             )
 
@@ -632,13 +696,106 @@ def render_voice_tab(cfg: Dict) -> None:
 
 # ── Tab 2: Imaging ─────────────────────────────────────────────────────────────
 
-def render_imaging_tab(cfg: Dict) -> None:
+async def _run_imaging(
+    cfg: Dict,
+    pil_img: "Image.Image",
+    img_bytes: bytes,
+    modality: str,
+    prior: str,
+    which: set,
+) -> Dict[str, object]:
+    """
+    Run the selected imaging actions ("describe", "compare", "classify")
+    concurrently. Failures are returned in place of the result, not raised.
+    """
+    jobs: Dict[str, object] = {}
+
+    if cfg["img_backend"] == "Gemini Vision (cloud)" and cfg["gemini_key"]:
+        client = get_vision_client(cfg["gemini_key"])
+        if "describe" in which:
+            jobs["describe"] = asyncio.to_thread(
+                client.analyze,
+                img_bytes,
+                f"This is a {modality}. Provide a detailed radiological report: "
+                "(1) Image quality, (2) Key findings, (3) Pertinent negatives, "
+                "(4) Impression, (5) Recommendations.",
+            )
+        if "compare" in which:
+            jobs["compare"] = asyncio.to_thread(
+                client.analyze,
+                img_bytes,
+                f"This is a current {modality}. Prior report: {prior}\n"
+                "Compare: (1) Interval changes, (2) Stable findings, "
+                "(3) New findings, (4) Resolved, (5) Impression.",
+            )
+    elif which & {"describe", "compare"}:
+        analyzer, _ = get_image_analyzer(cfg["hf_token"], cfg["gemini_key"])
+        if which >= {"describe", "compare"}:
+            # Both prompts go through one batched generate() on the shared model
+            jobs["workup"] = asyncio.to_thread(
+                analyzer.analyze_all, pil_img, modality, None, prior
+            )
+        elif "describe" in which:
+            jobs["describe"] = asyncio.to_thread(analyzer.describe, pil_img, modality)
+        else:
+            jobs["compare"] = asyncio.to_thread(
+                analyzer.compare_with_prior, pil_img, prior, modality
+            )
+
+    if "classify" in which:
+        _, siglip = get_image_analyzer(cfg["hf_token"], cfg["gemini_key"])
+        jobs["classify"] = asyncio.to_thread(siglip.classify, pil_img, None, modality)
+
+    results = dict(zip(jobs, await asyncio.gather(*jobs.values(), return_exceptions=True)))
+    workup = results.pop("workup", None)
+    if isinstance(workup, dict):
+        results["describe"] = workup.get("describe", "")
+        results["compare"] = workup.get("compare", "")
+    elif workup is not None:
+        results["describe"] = workup
+    return results
+
+
+@st.cache_data(show_spinner=False)
+def _render_siglip_bars(scores: Tuple[Tuple[str, float], ...]) -> str:
+    bars = []
+    for label, score in scores:
+        pct = int(score * 100)
+        bars.append(
+            f"""<div class="score-bar-wrap">
+  <div class="score-label">
+    <span>{label}</span>
+    <span style='color:#1ABC9C; font-weight:700;'>{pct}%</span>
+  </div>
+  <div class="score-bar-bg">
+    <div class="score-bar-fill" style="width:{pct}%;"></div>
+  </div>
+</div>"""
+        )
+    return "\n".join(bars)
+
+
+@st.cache_resource(show_spinner=False, max_entries=8, hash_funcs=_HASH_FUNCS)
+def _decode_image(upload: UploadedFile) -> Tuple[bytes, "Image.Image"]:
+    """
+    Decode an uploaded image once; reruns reuse the cached PIL image.
+
+    Held by cache_resource (not pickled per hit), so callers must not
+    modify the returned image in place.
+    """
+    file_bytes = upload.getvalue()
+    return file_bytes, _pil().open(io.BytesIO(file_bytes)).convert("RGB")
+
+
+@st.fragment
+def render_imaging_tab() -> None:
+    cfg = st.session_state.cfg
     col_left, col_right = st.columns([1, 1], gap="large")
 
     with col_left:
-        st.markdown('<div class="med-card">', unsafe_allow_html=True)
-        st.markdown(
-            '<div class="med-card-title">🔬 Image Upload</div>', unsafe_allow_html=True
+        _hcat(
+            '<div class="med-card">',
+            _card_title("Image Upload", "🔬"),
         )
 
         modality = st.selectbox(
@@ -654,9 +811,7 @@ def render_imaging_tab(cfg: Dict) -> None:
 
         if uploaded_img:
             try:
-                from PIL import Image
-                img_bytes = uploaded_img.read()
-                pil_img = Image.open(io.BytesIO(img_bytes)).convert("RGB")
+                img_bytes, pil_img = _decode_image(uploaded_img)
                 st.image(pil_img, caption=f"{modality} — {uploaded_img.name}", use_container_width=True)
             except Exception as e:
                 st.error(f"Could not load image: {e}")
@@ -697,94 +852,76 @@ def render_imaging_tab(cfg: Dict) -> None:
                 disabled=pil_img is None,
             )
 
+        run_all_btn = st.button(
+            "⚡ Run All", use_container_width=True, disabled=pil_img is None
+        )
+
         # Run analyses
-        if analyse_btn and pil_img:
-            with st.spinner("Analysing image with MedGemma 4B…"):
-                if cfg["img_backend"] == "Gemini Vision (cloud)" and cfg["gemini_key"]:
-                    from medecho.imaging import GeminiVisionClient
-                    client = GeminiVisionClient(api_key=cfg["gemini_key"])
-                    result = client.analyze(
-                        img_bytes,
-                        f"This is a {modality}. Provide a detailed radiological report: "
-                        "(1) Image quality, (2) Key findings, (3) Pertinent negatives, "
-                        "(4) Impression, (5) Recommendations.",
-                    )
+        which = set()
+        if analyse_btn or run_all_btn:
+            which.add("describe")
+        if (compare_btn or run_all_btn) and prior.strip():
+            which.add("compare")
+        if (classify_btn or run_all_btn) and cfg["use_siglip"]:
+            which.add("classify")
+
+        if which and pil_img:
+            with st.spinner("Running image analysis…"):
+                results = asyncio.run(
+                    _run_imaging(cfg, pil_img, img_bytes, modality, prior, which)
+                )
+
+            analysis: Dict = {}
+            for action in ("describe", "compare"):
+                if action not in results:
+                    continue
+                if isinstance(results[action], Exception):
+                    st.error(f"Image analysis failed: {results[action]}")
+                elif action == "describe":
+                    analysis["description"] = results[action]
                 else:
-                    analyzer, _ = get_image_analyzer(cfg["hf_token"], cfg["gemini_key"])
-                    result = analyzer.describe(pil_img, modality=modality)
-                st.session_state.image_analysis = {"description": result, "modality": modality}
-            st.success("Analysis complete!")
-
-        if compare_btn and pil_img and prior.strip():
-            with st.spinner("Comparing with prior report…"):
-                if cfg["img_backend"] == "Gemini Vision (cloud)" and cfg["gemini_key"]:
-                    from medecho.imaging import GeminiVisionClient
-                    client = GeminiVisionClient(api_key=cfg["gemini_key"])
-                    result = client.analyze(
-                        img_bytes,
-                        f"This is a current {modality}. Prior report: {prior}\n"
-                        "Compare: (1) Interval changes, (2) Stable findings, "
-                        "(3) New findings, (4) Resolved, (5) Impression.",
-                    )
+                    analysis["comparison"] = results[action]
+                    analysis["prior"] = prior
+            if analysis:
+                analysis["modality"] = modality
+                st.session_state.image_analysis = analysis
+                _persist_encounter()
+                st.success("Analysis complete!")
+
+            if "classify" in results:
+                if isinstance(results["classify"], Exception):
+                    st.error(f"MedSigLIP unavailable (weights not downloaded): {results['classify']}")
                 else:
-                    analyzer, _ = get_image_analyzer(cfg["hf_token"], cfg["gemini_key"])
-                    result = analyzer.compare_with_prior(pil_img, prior, modality)
-                st.session_state.image_analysis = {
-                    "comparison": result,
-                    "modality": modality,
-                    "prior": prior,
-                }
-            st.success("Comparison complete!")
-
-        if classify_btn and pil_img and cfg["use_siglip"]:
-            with st.spinner("Running MedSigLIP zero-shot classification…"):
-                try:
-                    _, siglip = get_image_analyzer(cfg["hf_token"], cfg["gemini_key"])
-                    scores = siglip.classify(pil_img, modality=modality)
-                    st.session_state.siglip_scores = scores
-                except Exception as exc:
-                    st.error(f"MedSigLIP unavailable (weights not downloaded): {exc}")
+                    st.session_state.siglip_scores = results["classify"]
+                    _persist_encounter()
 
         st.markdown("</div>", unsafe_allow_html=True)
 
     with col_right:
         # ── MedSigLIP scores ────────────────────────────────────────
         if st.session_state.siglip_scores:
-            st.markdown('<div class="med-card">', unsafe_allow_html=True)
+            _hcat(
+                '<div class="med-card">',
+                _card_title("MedSigLIP Classification", "🎯"),
+            )
             st.markdown(
-                '<div class="med-card-title">🎯 MedSigLIP Classification</div>',
+                _render_siglip_bars(
+                    tuple((item["label"], item["score"]) for item in st.session_state.siglip_scores)
+                ),
                 unsafe_allow_html=True,
             )
-            for item in st.session_state.siglip_scores:
-                score = item["score"]
-                pct = int(score * 100)
-                st.markdown(
-                    f"""
-                    <div class="score-bar-wrap">
-                      <div class="score-label">
-                        <span>{item['label']}</span>
-                        <span style='color:#1ABC9C; font-weight:700;'>{pct}%</span>
-                      </div>
-                      <div class="score-bar-bg">
-                        <div class="score-bar-fill" style="width:{pct}%;"></div>
-                      </div>
-                    </div>
-                    """,
-                    unsafe_allow_html=True,
-                )
             st.markdown("</div>", unsafe_allow_html=True)
 
         # ── Image Analysis Result ───────────────────────────────────
         if st.session_state.image_analysis:
-            st.markdown('<div class="med-card">', unsafe_allow_html=True)
-            st.markdown(
-                '<div class="med-card-title">📊 Radiology Report</div>',
-                unsafe_allow_html=True,
+            _hcat(
+                '<div class="med-card">',
+                _card_title("Radiology Report", "📊"),
             )
             analysis = st.session_state.image_analysis
             if "description" in analysis:
                 st.markdown(analysis["description"])
-            elif "comparison" in analysis:
+            if "comparison" in analysis:
                 st.markdown("**Longitudinal Comparison:**")
                 st.markdown(analysis["comparison"])
             st.markdown("</div>", unsafe_allow_html=True)
@@ -802,43 +939,112 @@ def render_imaging_tab(cfg: Dict) -> None:
 
 # ── Tab 3: Clinical Summary ────────────────────────────────────────────────────
 
-def render_clinical_tab(cfg: Dict) -> None:
+def _run_clinical_analysis(cfg: Dict) -> None:
+    """
+    Fill both the differential diagnosis and the structured extraction from
+    one fused LLM call, streaming the raw output while it is generated.
+    """
+    engine = get_clinical_engine(cfg["gemini_key"], cfg["model_size"])
+    transcript = st.session_state.redacted_transcript
+    stream_box = st.empty()
+    with stream_box.container():
+        raw = st.write_stream(
+            engine.analyze_stream(
+                transcript, ehr_summary=st.session_state.ehr_summary or None
+            )
+        )
+    stream_box.empty()
+    # write_stream returns a list rather than a str for an empty stream
+    result = engine.parse_analysis(raw if isinstance(raw, str) else "", transcript)
+    st.session_state.diff_dx = result["diagnosis"]
+    st.session_state.structured_data = result["structured"]
+    _persist_encounter()
+
+
+def _json_preview(obj: Dict) -> str:
+    """Pretty-print *obj* for display, with orjson when it is installed."""
+    try:
+        return json_dumps(obj, indent=True).decode()
+    except TypeError:
+        pass  # e.g. a non-JSON value; stringify it with the stdlib encoder
+    return json.dumps(obj, indent=2, default=str)
+
+
+def _ddx_cards_html(ddx: List[Dict]) -> str:
+    """Render every differential as a card in one HTML block (one frontend element)."""
+    cards = []
+    for item in ddx:
+        conf = html.escape(str(item.get("confidence", "low")))
+        features = html.escape(", ".join(map(str, item.get("key_features", []))))
+        cards.append(
+            f"""<div style="border-left:3px solid #1B4F72; padding:8px 12px; margin-bottom:8px;
+            background:rgba(27,79,114,0.15); border-radius:0 8px 8px 0;">
+  <strong>{html.escape(str(item.get('condition', '—')))}</strong>
+  <span class="badge-conf badge-{conf}" style="margin-left:8px;">{conf}</span>
+  <p style="color:#BDC3C7; font-size:0.82rem; margin:4px 0 0 0;">{features}</p>
+</div>"""
+        )
+    return "<strong>Differential Diagnoses:</strong>" + "".join(cards)
+
+
+def _bullet_list(title: str, items: List[str]) -> str:
+    """Render a bold title and its items as one HTML block (one frontend element)."""
+    lis = "".join(f"<li>{html.escape(str(item))}</li>" for item in items)
+    return f"<strong>{html.escape(title)}</strong><ul>{lis}</ul>"
+
+
+@st.fragment
+def render_clinical_tab() -> None:
+    cfg = st.session_state.cfg
     if not st.session_state.redacted_transcript:
         st.info("💡 Complete the Voice tab first to generate a transcript for clinical analysis.")
         return
 
+    img_text = (
+        st.session_state.image_analysis.get("description")
+        or st.session_state.image_analysis.get("comparison")
+        or ""
+    )
+    recommendations = None
+    if st.button("🚀 Run Full Clinical Analysis", use_container_width=True):
+        with st.spinner("Running differential, extraction and synthesis…"):
+            engine = get_clinical_engine(cfg["gemini_key"], cfg["model_size"])
+            result = engine.analyze_all(
+                st.session_state.redacted_transcript,
+                ehr_summary=st.session_state.ehr_summary or None,
+                image_findings=img_text or None,
+            )
+        st.session_state.diff_dx = result["diagnosis"]
+        st.session_state.structured_data = result["structured"]
+        _persist_encounter()
+        recommendations = result["recommendations"]
+
     col_left, col_right = st.columns([1, 1], gap="large")
 
     with col_left:
-        st.markdown('<div class="med-card">', unsafe_allow_html=True)
-        st.markdown(
-            '<div class="med-card-title">🧠 Differential Diagnosis</div>',
-            unsafe_allow_html=True,
+        _hcat(
+            '<div class="med-card">',
+            _card_title("Differential Diagnosis", "🧠"),
         )
 
         if st.button("🔍 Generate Differential Diagnosis", use_container_width=True):
-            with st.spinner("Consulting MedGemma for differential diagnosis…"):
-                engine = get_clinical_engine(cfg["gemini_key"], cfg["model_size"])
-                st.session_state.diff_dx = engine.differential_diagnosis(
-                    st.session_state.redacted_transcript,
-                    ehr_summary=st.session_state.ehr_summary or None,
-                )
+            _run_clinical_analysis(cfg)
             st.success("Differential diagnosis generated!")
 
         if st.session_state.diff_dx:
             dx = st.session_state.diff_dx
             primary = dx.get("primary_diagnosis", {})
             if primary:
-                conf = primary.get("confidence", "low")
+                conf = html.escape(str(primary.get("confidence", "low")))
                 badge_class = f"badge-{conf}"
                 st.markdown(
                     f"""
                     <div style="background:rgba(26,188,156,0.08); border:1px solid #1ABC9C;
                                 border-radius:10px; padding:16px; margin-bottom:12px;">
-                      <strong style="font-size:1rem;">Primary: {primary.get('condition','—')}</strong>
+                      <strong style="font-size:1rem;">Primary: {html.escape(str(primary.get('condition', '—')))}</strong>
                       <span class="badge-conf {badge_class}" style="margin-left:8px;">{conf}</span>
                       <p style="color:#BDC3C7; margin-top:8px; font-size:0.88rem;">
-                        {primary.get('reasoning','—')}
+                        {html.escape(str(primary.get('reasoning', '—')))}
                       </p>
                     </div>
                     """,
@@ -847,51 +1053,29 @@ def render_clinical_tab(cfg: Dict) -> None:
 
             ddx = dx.get("differential_diagnoses", [])
             if ddx:
-                st.markdown("**Differential Diagnoses:**")
-                for item in ddx:
-                    conf = item.get("confidence", "low")
-                    badge_class = f"badge-{conf}"
-                    features = ", ".join(item.get("key_features", []))
-                    st.markdown(
-                        f"""
-                        <div style="border-left:3px solid #1B4F72; padding:8px 12px; margin-bottom:8px;
-                                    background:rgba(27,79,114,0.15); border-radius:0 8px 8px 0;">
-                          <strong>{item.get('condition','—')}</strong>
-                          <span class="badge-conf {badge_class}" style="margin-left:8px;">{conf}</span>
-                          <p style="color:#BDC3C7; font-size:0.82rem; margin:4px 0 0 0;">{features}</p>
-                        </div>
-                        """,
-                        unsafe_allow_html=True,
-                    )
+                st.markdown(_ddx_cards_html(ddx), unsafe_allow_html=True)
 
             red_flags = dx.get("red_flags", [])
             if red_flags:
-                st.markdown("**🚨 Red Flags:**")
-                for flag in red_flags:
-                    st.markdown(f"- {flag}")
+                st.markdown(_bullet_list("🚨 Red Flags:", red_flags), unsafe_allow_html=True)
 
             workup = dx.get("urgent_workup", [])
             if workup:
-                st.markdown("**🔬 Urgent Workup:**")
-                for item in workup:
-                    st.markdown(f"- {item}")
+                st.markdown(_bullet_list("🔬 Urgent Workup:", workup), unsafe_allow_html=True)
 
         st.markdown("</div>", unsafe_allow_html=True)
 
     with col_right:
-        st.markdown('<div class="med-card">', unsafe_allow_html=True)
-        st.markdown(
-            '<div class="med-card-title">📋 Structured Encounter Extraction</div>',
-            unsafe_allow_html=True,
+        _hcat(
+            '<div class="med-card">',
+            _card_title("Structured Encounter Extraction", "📋"),
         )
 
         if st.button("⚙️ Extract Structured Data", use_container_width=True):
-            with st.spinner("Extracting structured clinical data…"):
-                engine = get_clinical_engine(cfg["gemini_key"], cfg["model_size"])
-                st.session_state.structured_data = engine.extract_structured(
-                    st.session_state.redacted_transcript
-                )
-            st.success("Structured data extracted!")
+            _run_clinical_analysis(cfg)
+            st.toast("Structured data extracted!")
+            # The differential column has already rendered; refresh it too.
+            st.rerun(scope="fragment")
 
         if st.session_state.structured_data:
             sd = st.session_state.structured_data
@@ -899,9 +1083,7 @@ def render_clinical_tab(cfg: Dict) -> None:
             def _list_block(title: str, key: str, icon: str) -> None:
                 items = sd.get(key, [])
                 if items:
-                    st.markdown(f"**{icon} {title}**")
-                    for item in items:
-                        st.markdown(f"  - {item}")
+                    st.markdown(_bullet_list(f"{icon} {title}", items), unsafe_allow_html=True)
 
             _list_block("Symptoms", "symptoms", "🤒")
             _list_block("Radiology Findings", "radiology_findings", "🩻")
@@ -913,7 +1095,7 @@ def render_clinical_tab(cfg: Dict) -> None:
             if vs:
                 st.markdown("**❤️ Vital Signs**")
                 vitals_html = " ".join(
-                    f'<span class="medecho-badge">{k}: {v}</span>'
+                    f'<span class="medecho-badge">{html.escape(str(k))}: {html.escape(str(v))}</span>'
                     for k, v in vs.items()
                 )
                 st.markdown(vitals_html, unsafe_allow_html=True)
@@ -926,13 +1108,13 @@ def render_clinical_tab(cfg: Dict) -> None:
             if notes:
                 st.markdown("**📝 Physician Notes**")
                 st.markdown(
-                    f'<div class="transcript-box">{notes}</div>',
+                    f'<div class="transcript-box">{html.escape(str(notes))}</div>',
                     unsafe_allow_html=True,
                 )
 
             # Show raw JSON
             with st.expander("🗂️ Raw JSON"):
-                st.json(sd)
+                st.code(_json_preview(sd), language="json")
 
         st.markdown("</div>", unsafe_allow_html=True)
 
@@ -940,35 +1122,64 @@ def render_clinical_tab(cfg: Dict) -> None:
     if st.session_state.redacted_transcript and (
         st.session_state.ehr_summary or st.session_state.image_analysis
     ):
-        st.markdown('<div class="med-card">', unsafe_allow_html=True)
-        st.markdown(
-            '<div class="med-card-title">🌐 Context-Aware Clinical Synthesis</div>',
-            unsafe_allow_html=True,
+        _hcat(
+            '<div class="med-card">',
+            _card_title("Context-Aware Clinical Synthesis", "🌐"),
         )
         if st.button("💡 Generate Holistic Recommendations", use_container_width=True):
-            with st.spinner("Synthesising all available clinical data…"):
-                engine = get_clinical_engine(cfg["gemini_key"], cfg["model_size"])
-                img_text = (
-                    st.session_state.image_analysis.get("description")
-                    or st.session_state.image_analysis.get("comparison")
-                    or ""
-                )
-                synthesis = engine.context_aware_suggestion(
+            engine = get_clinical_engine(cfg["gemini_key"], cfg["model_size"])
+            st.write_stream(
+                engine.context_aware_suggestion_stream(
                     st.session_state.redacted_transcript,
-                    st.session_state.ehr_summary or "Not provided.",
+                    st.session_state.ehr_summary or None,
                     image_findings=img_text or None,
                 )
-            st.markdown(synthesis)
+            )
+        elif recommendations:
+            st.markdown(recommendations)
         st.markdown("</div>", unsafe_allow_html=True)
 
 
 # ── Tab 4: Output & Export ─────────────────────────────────────────────────────
 
-def render_output_tab(cfg: Dict) -> None:
-    exp, qr_gen = get_exporters()
+@st.cache_data(show_spinner=False, max_entries=16)
+def _word_count(text: str) -> int:
+    # Approximate (one word per space); str.count runs in C without allocating
+    return text.count(" ") + 1 if text else 0
+
+
+@st.cache_data(show_spinner=False)
+def _metric_tiles_html(
+    transcript_words: int, num_symptoms: int, num_dx: int, has_imaging: bool
+) -> str:
+    return f"""
+<div class="metric-row">
+  <div class="metric-tile">
+    <div class="val">{transcript_words}</div>
+    <div class="lbl">Transcript Words</div>
+  </div>
+  <div class="metric-tile">
+    <div class="val">{num_symptoms}</div>
+    <div class="lbl">Symptoms</div>
+  </div>
+  <div class="metric-tile">
+    <div class="val">{num_dx}</div>
+    <div class="lbl">Differentials</div>
+  </div>
+  <div class="metric-tile">
+    <div class="val">{'✅' if has_imaging else '—'}</div>
+    <div class="lbl">Imaging</div>
+  </div>
+</div>
+"""
 
-    # ── Build encounter package ─────────────────────────────────────
-    encounter = {
+
+def _build_encounter(cfg: Dict) -> Dict:
+    """
+    Assemble the encounter package from session state.  Only called when an
+    export, QR code or JSON preview actually needs it, not on every rerun.
+    """
+    return {
         "encounter_id": st.session_state.encounter_id,
         "date": cfg["encounter_date"],
         "patient_name": cfg["patient_name"] or "[REDACTED]",
@@ -983,51 +1194,43 @@ def render_output_tab(cfg: Dict) -> None:
         "siglip_scores": st.session_state.siglip_scores,
     }
 
+
+@st.cache_data(ttl=2.0, show_spinner=False)
+def _offline_stats() -> Dict:
+    """Storage counters for the Offline Store card; walks the store directory."""
+    return _offline_mod().OfflineStore().get_stats()
+
+
+@st.fragment
+def render_output_tab() -> None:
+    cfg = st.session_state.cfg
+    exp, qr_gen = get_exporter(), get_qr_generator()
+
     col_left, col_right = st.columns([1, 1], gap="large")
 
     with col_left:
-        st.markdown('<div class="med-card">', unsafe_allow_html=True)
-        st.markdown(
-            '<div class="med-card-title">💾 Export Encounter</div>',
-            unsafe_allow_html=True,
+        _hcat(
+            '<div class="med-card">',
+            _card_title("Export Encounter", "💾"),
         )
 
         # Metrics
-        num_symptoms = len(st.session_state.structured_data.get("symptoms", []))
-        num_dx = len(
-            st.session_state.diff_dx.get("differential_diagnoses", [])
-        )
-        has_imaging = bool(st.session_state.image_analysis)
-        transcript_words = len(st.session_state.redacted_transcript.split())
-
         st.markdown(
-            f"""
-            <div class="metric-row">
-              <div class="metric-tile">
-                <div class="val">{transcript_words}</div>
-                <div class="lbl">Transcript Words</div>
-              </div>
-              <div class="metric-tile">
-                <div class="val">{num_symptoms}</div>
-                <div class="lbl">Symptoms</div>
-              </div>
-              <div class="metric-tile">
-                <div class="val">{num_dx}</div>
-                <div class="lbl">Differentials</div>
-              </div>
-              <div class="metric-tile">
-                <div class="val">{'✅' if has_imaging else '—'}</div>
-                <div class="lbl">Imaging</div>
-              </div>
-            </div>
-            """,
+            _metric_tiles_html(
+                _word_count(st.session_state.redacted_transcript),
+                len(st.session_state.structured_data.get("symptoms", [])),
+                len(st.session_state.diff_dx.get("differential_diagnoses", [])),
+                bool(st.session_state.image_analysis),
+            ),
             unsafe_allow_html=True,
         )
 
         if st.button("🔒 Generate Encrypted Export", use_container_width=True):
             with st.spinner("Encrypting encounter data…"):
-                data = exp.export(encounter, encrypt=cfg["encrypt_output"])
-                st.session_state.export_bytes = data
+                # Encrypt straight into the blob file rather than via bytes in memory
+                path = _new_blob_path()
+                exp.export_to_file(_build_encounter(cfg), path, encrypt=cfg["encrypt_output"])
+                _set_blob("export_bytes", _BlobRef(path=path, size=os.path.getsize(path)))
                 st.session_state.export_key = exp.key_b64
             st.success(
                 "Export ready! "
@@ -1038,7 +1241,7 @@ def render_output_tab(cfg: Dict) -> None:
             fname = f"encounter_{st.session_state.encounter_id}.{'enc' if cfg['encrypt_output'] else 'json'}"
             st.download_button(
                 "⬇️ Download Encounter File",
-                data=st.session_state.export_bytes,
+                data=_load(st.session_state.export_bytes),
                 file_name=fname,
                 mime="application/octet-stream",
                 use_container_width=True,
@@ -1050,38 +1253,40 @@ def render_output_tab(cfg: Dict) -> None:
 
         # Raw JSON preview
         with st.expander("🗂️ Preview Full Encounter JSON"):
-            st.json(encounter)
+            # Expander bodies always execute; only serialise on request.
+            if st.checkbox("Show JSON", key="show_encounter_json"):
+                st.code(_json_preview(_build_encounter(cfg)), language="json")
 
         st.markdown("</div>", unsafe_allow_html=True)
 
     with col_right:
-        st.markdown('<div class="med-card">', unsafe_allow_html=True)
-        st.markdown(
-            '<div class="med-card-title">📱 Patient QR Code</div>',
-            unsafe_allow_html=True,
+        _hcat(
+            '<div class="med-card">',
+            _card_title("Patient QR Code", "📱"),
         )
 
         if cfg["generate_qr"] and qr_gen.available:
             if st.button("📲 Generate QR Code", use_container_width=True):
                 with st.spinner("Generating QR code…"):
-                    qr_bytes = qr_gen.generate_bytes(encounter)
-                    st.session_state.qr_bytes = qr_bytes
+                    qr_bytes = qr_gen.generate_bytes(_build_encounter(cfg))
+                    _store_blob("qr_bytes", qr_bytes)
                 st.success("QR code generated!")
 
             if st.session_state.qr_bytes:
+                qr_png = _load(st.session_state.qr_bytes)
                 st.markdown(
                     '<div class="qr-container" style="text-align:center; margin:0 auto; display:block; width:fit-content;">',
                     unsafe_allow_html=True,
                 )
                 st.image(
-                    st.session_state.qr_bytes,
+                    qr_png,
                     caption="Scan to access encounter summary",
                     width=250,
                 )
                 st.markdown("</div>", unsafe_allow_html=True)
                 st.download_button(
                     "⬇️ Download QR Code",
-                    data=st.session_state.qr_bytes,
+                    data=qr_png,
                     file_name=f"qr_{st.session_state.encounter_id}.png",
                     mime="image/png",
                     use_container_width=True,
@@ -1090,19 +1295,17 @@ def render_output_tab(cfg: Dict) -> None:
             msg = (
                 "QR generation disabled in settings."
                 if not cfg["generate_qr"]
-                else "Install `qrcode[pil]` to enable QR generation."
+                else "Install `segno` to enable QR generation."
             )
             st.info(msg)
 
         # Offline status
         st.markdown("---")
         st.markdown(
-            '<div class="med-card-title">📡 Offline Status</div>',
+            _card_title("Offline Status", "📡"),
             unsafe_allow_html=True,
         )
-        from medecho.offline import OfflineStore, is_online
-        store = OfflineStore()
-        stats = store.get_stats()
+        stats = _offline_stats()
         st.markdown(
             f"""
             <div class="metric-row">
@@ -1123,7 +1326,7 @@ def render_output_tab(cfg: Dict) -> None:
             unsafe_allow_html=True,
         )
 
-        connectivity = "🟢 Online" if is_online() else "🔴 Offline"
+        connectivity = "🟢 Online" if _check_connectivity() else "🔴 Offline"
         st.markdown(f"**Connectivity:** {connectivity}")
 
         st.markdown("</div>", unsafe_allow_html=True)
@@ -1131,69 +1334,54 @@ def render_output_tab(cfg: Dict) -> None:
 
 # ── Tab 5: About / Model Info ──────────────────────────────────────────────────
 
-def render_about_tab() -> None:
-    st.markdown(
-        """
-        <div class="med-card">
-          <div class="med-card-title">ℹ️ About MedEcho</div>
-          <p>
-            <strong>MedEcho</strong> is an open-source AI Clinical Scribe and Radiology Assistant
-            built on Google's <strong>Health AI Developer Foundations (HAI-DEF)</strong> model suite.
-          </p>
-        </div>
-        """,
-        unsafe_allow_html=True,
-    )
-
-    col1, col2 = st.columns(2)
+_ABOUT_INTRO_HTML = """
+<div class="med-card">
+  <div class="med-card-title">ℹ️ About MedEcho</div>
+  <p>
+    <strong>MedEcho</strong> is an open-source AI Clinical Scribe and Radiology Assistant
+    built on Google's <strong>Health AI Developer Foundations (HAI-DEF)</strong> model suite.
+  </p>
+</div>
+"""
 
-    with col1:
-        st.markdown(
-            """
-            <div class="med-card">
-              <div class="med-card-title">🤖 HAI-DEF Models Used</div>
-              <ul>
-                <li><strong>MedGemma 4B Multimodal</strong> – radiology image description,
-                    anatomical localization, longitudinal comparison</li>
-                <li><strong>MedGemma 27B Text</strong> – differential diagnosis,
-                    structured extraction, clinical reasoning</li>
-                <li><strong>MedSigLIP</strong> – zero-shot medical image classification
-                    (Chest X-ray, pathology, dermatology)</li>
-                <li><strong>MedASR</strong> – radiology-specialised speech recognition
-                    (with Whisper local fallback)</li>
-              </ul>
-            </div>
-            """,
-            unsafe_allow_html=True,
-        )
+_ABOUT_MODELS_HTML = """
+<div class="med-card">
+  <div class="med-card-title">🤖 HAI-DEF Models Used</div>
+  <ul>
+    <li><strong>MedGemma 4B Multimodal</strong> – radiology image description,
+        anatomical localization, longitudinal comparison</li>
+    <li><strong>MedGemma 27B Text</strong> – differential diagnosis,
+        structured extraction, clinical reasoning</li>
+    <li><strong>MedSigLIP</strong> – zero-shot medical image classification
+        (Chest X-ray, pathology, dermatology)</li>
+    <li><strong>MedASR</strong> – radiology-specialised speech recognition
+        (with Whisper local fallback)</li>
+  </ul>
+</div>
+"""
 
-    with col2:
-        st.markdown(
-            """
-            <div class="med-card">
-              <div class="med-card-title">🛡️ Privacy & Security Features</div>
-              <ul>
-                <li>🔍 <strong>PII Redaction</strong> – regex-based removal of names,
-                    phone numbers, SSNs, MRNs before display</li>
-                <li>🔒 <strong>AES-256-GCM Encryption</strong> – encounter files encrypted
-                    with the <code>cryptography</code> (Fernet) library</li>
-                <li>📱 <strong>QR Code Export</strong> – compact encounter summary as
-                    patient-portable QR</li>
-                <li>📡 <strong>Offline Mode</strong> – full local save when internet
-                    is unavailable; auto-sync on reconnect</li>
-                <li>🎙️ <strong>VAD Gating</strong> – records only when human voice
-                    is detected (webrtcvad)</li>
-              </ul>
-            </div>
-            """,
-            unsafe_allow_html=True,
-        )
+_ABOUT_SECURITY_HTML = """
+<div class="med-card">
+  <div class="med-card-title">🛡️ Privacy & Security Features</div>
+  <ul>
+    <li>🔍 <strong>PII Redaction</strong> – regex-based removal of names,
+        phone numbers, SSNs, MRNs before display</li>
+    <li>🔒 <strong>AES-256-GCM Encryption</strong> – encounter files encrypted
+        with the <code>cryptography</code> library (AESGCM)</li>
+    <li>📱 <strong>QR Code Export</strong> – compact encounter summary as
+        patient-portable QR</li>
+    <li>📡 <strong>Offline Mode</strong> – full local save when internet
+        is unavailable; auto-sync on reconnect</li>
+    <li>🎙️ <strong>VAD Gating</strong> – records only when human voice
+        is detected (webrtcvad)</li>
+  </ul>
+</div>
+"""
 
-    st.markdown(
-        """
-        <div class="med-card">
-          <div class="med-card-title">⚙️ Architecture</div>
-          <pre style="color:#1ABC9C; font-size:0.82rem; background:#0D1B2A; padding:12px; border-radius:8px;">
+_ABOUT_ARCH_HTML = """
+<div class="med-card">
+  <div class="med-card-title">⚙️ Architecture</div>
+  <pre style="color:#1ABC9C; font-size:0.82rem; background:#0D1B2A; padding:12px; border-radius:8px;">
 🎙️  Microphone / Audio Upload
         │
         ▼  webrtcvad (VAD gating)
@@ -1212,34 +1400,50 @@ def render_about_tab() -> None:
         ▼  EncryptedJSONExporter (AES-256-GCM via cryptography)
         ▼  QRCodeGenerator (patient handoff)
         ▼  OfflineStore (local fallback)
-          </pre>
-        </div>
-        """,
-        unsafe_allow_html=True,
-    )
+  </pre>
+</div>
+"""
+
+
+@st.fragment
+def render_about_tab() -> None:
+    st.markdown(_ABOUT_INTRO_HTML, unsafe_allow_html=True)
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.markdown(_ABOUT_MODELS_HTML, unsafe_allow_html=True)
+
+    with col2:
+        st.markdown(_ABOUT_SECURITY_HTML, unsafe_allow_html=True)
+
+    st.markdown(_ABOUT_ARCH_HTML, unsafe_allow_html=True)
 
 
 # ── Main entry point ───────────────────────────────────────────────────────────
 
 def main() -> None:
-    cfg = render_sidebar()
-    render_header(cfg)
+    _prewarm_imports()
+    _init_state()
+    with st.sidebar:
+        render_sidebar()
+    render_header()
 
     tab_ear, tab_eye, tab_brain, tab_output, tab_about = st.tabs(
         ["🎙️ Ear (Voice)", "🔬 Eye (Imaging)", "🧠 Brain (Clinical)", "📤 Output", "ℹ️ About"]
     )
 
     with tab_ear:
-        render_voice_tab(cfg)
+        render_voice_tab()
 
     with tab_eye:
-        render_imaging_tab(cfg)
+        render_imaging_tab()
 
     with tab_brain:
-        render_clinical_tab(cfg)
+        render_clinical_tab()
 
     with tab_output:
-        render_output_tab(cfg)
+        render_output_tab()
 
     with tab_about:
         render_about_tab()
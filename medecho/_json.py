@@ -0,0 +1,27 @@
+"""
+JSON helpers shared by the MedEcho modules.
+Uses orjson when it is installed and falls back to the standard library.
+"""
+
+import json
+from typing import Any, Dict, Union
+
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None
+
+
+def json_dumps(obj: Dict, indent: bool = False) -> bytes:
+    """UTF-8 JSON bytes for *obj*, via orjson when it is installed."""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, option=option)
+    if indent:
+        return json.dumps(obj, indent=2, ensure_ascii=False).encode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def json_loads(data: Union[bytes, str]) -> Any:
+    # orjson.JSONDecodeError subclasses json.JSONDecodeError
+    return orjson.loads(data) if orjson is not None else json.loads(data)
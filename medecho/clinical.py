@@ -4,67 +4,128 @@ Handles differential diagnosis generation, structured encounter extraction,
 and EHR context integration using MedGemma 27B (text) or 4B.
 """
 
+import hashlib
 import json
 import logging
 import re
-from typing import Any, Dict, List, Optional
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from ._json import json_loads
 
 logger = logging.getLogger(__name__)
 
 # ── Prompt templates ───────────────────────────────────────────────────────────
 
-_DIFF_DX_PROMPT = """You are a senior clinician. Based on the following transcribed clinical encounter, generate a structured differential diagnosis.
+_DIFF_DX_PREFIX = """You are a senior clinician. Based on the following transcribed clinical encounter, generate a structured differential diagnosis.
 
 ENCOUNTER TRANSCRIPT:
-{transcript}
+"""
 
-{ehr_context}
+_DIFF_DX_SUFFIX = """
 
 Provide your response as a JSON object with the following structure:
-{{
-  "primary_diagnosis": {{
+{
+  "primary_diagnosis": {
     "condition": "...",
     "confidence": "high|medium|low",
     "reasoning": "..."
-  }},
+  },
   "differential_diagnoses": [
-    {{
+    {
       "condition": "...",
       "confidence": "high|medium|low",
       "key_features": ["...", "..."],
       "ruling_out": "..."
-    }}
+    }
   ],
   "red_flags": ["...", "..."],
   "urgent_workup": ["...", "..."]
-}}
+}
 
 Return ONLY valid JSON."""
 
-_EXTRACTION_PROMPT = """You are a clinical documentation specialist. Extract structured clinical information from this encounter transcript.
+_EXTRACTION_PREFIX = """You are a clinical documentation specialist. Extract structured clinical information from this encounter transcript.
 
 ENCOUNTER TRANSCRIPT:
-{transcript}
+"""
+
+_EXTRACTION_SUFFIX = """
 
 Extract and return a JSON object with EXACTLY this structure:
-{{
+{
   "symptoms": [],
   "radiology_findings": [],
   "suggested_medications": [],
   "follow_up_date": "",
-  "vital_signs": {{}},
+  "vital_signs": {},
   "allergies": [],
   "procedures_ordered": [],
   "diagnoses": [],
   "physician_notes": ""
-}}
+}
 
 Rules:
 - symptoms: list of symptom strings as mentioned
 - radiology_findings: any imaging findings mentioned
 - suggested_medications: drug names with dose/frequency if mentioned
 - follow_up_date: ISO date string or "" if not mentioned
-- vital_signs: dict of {{metric: value}} (e.g. {{"BP": "120/80", "HR": "72"}})
+- vital_signs: dict of {metric: value} (e.g. {"BP": "120/80", "HR": "72"})
+- allergies: drug/substance allergies mentioned
+- procedures_ordered: any procedures or tests ordered
+- diagnoses: working diagnoses mentioned
+- physician_notes: free-text summary of key clinical notes
+
+Return ONLY valid JSON."""
+
+_ANALYSIS_PREFIX = """You are a senior clinician and clinical documentation specialist. From the following transcribed clinical encounter, produce both a differential diagnosis and a structured extraction of the encounter.
+
+ENCOUNTER TRANSCRIPT:
+"""
+
+_ANALYSIS_SUFFIX = """
+
+Provide your response as a single JSON object with EXACTLY this structure:
+{
+  "diagnosis": {
+    "primary_diagnosis": {
+      "condition": "...",
+      "confidence": "high|medium|low",
+      "reasoning": "..."
+    },
+    "differential_diagnoses": [
+      {
+        "condition": "...",
+        "confidence": "high|medium|low",
+        "key_features": ["...", "..."],
+        "ruling_out": "..."
+      }
+    ],
+    "red_flags": ["...", "..."],
+    "urgent_workup": ["...", "..."]
+  },
+  "structured": {
+    "symptoms": [],
+    "radiology_findings": [],
+    "suggested_medications": [],
+    "follow_up_date": "",
+    "vital_signs": {},
+    "allergies": [],
+    "procedures_ordered": [],
+    "diagnoses": [],
+    "physician_notes": ""
+  }
+}
+
+Rules for "structured":
+- symptoms: list of symptom strings as mentioned
+- radiology_findings: any imaging findings mentioned
+- suggested_medications: drug names with dose/frequency if mentioned
+- follow_up_date: ISO date string or "" if not mentioned
+- vital_signs: dict of {metric: value} (e.g. {"BP": "120/80", "HR": "72"})
 - allergies: drug/substance allergies mentioned
 - procedures_ordered: any procedures or tests ordered
 - diagnoses: working diagnoses mentioned
@@ -72,7 +133,7 @@ Rules:
 
 Return ONLY valid JSON."""
 
-_EHR_SUMMARY_PROMPT = """Summarize the following patient history for clinical context. Be concise and highlight:
+_EHR_SUMMARY_PREFIX = """Summarize the following patient history for clinical context. Be concise and highlight:
 1. Relevant past diagnoses
 2. Current medications
 3. Known allergies
@@ -80,13 +141,24 @@ _EHR_SUMMARY_PROMPT = """Summarize the following patient history for clinical co
 5. Key risk factors
 
 PATIENT HISTORY:
-{ehr_text}
+"""
+
+_EHR_SUMMARY_SUFFIX = """
 
 Return a brief clinical summary (3-5 sentences)."""
 
 # Maximum characters of raw LLM output to include when JSON parsing fails
 _MAX_FALLBACK_REASONING_LENGTH = 500
 
+# Tokenized prompts kept per MedGemmaTextClient for local generation
+_ENCODED_PROMPTS_MAX = 16
+
+# Free-text results (EHR summaries, recommendations) memoized per ClinicalEngine
+_MEMO_MAX_ENTRIES = 32
+
+# How long a ping() result is reused before the API is asked again
+_PING_TTL_S = 60.0
+
 
 # ── MedGemma Text Client ────────────────────────────────────────────────────────
 
@@ -111,36 +183,69 @@ class MedGemmaTextClient:
         hf_token: Optional[str] = None,
         gemini_api_key: Optional[str] = None,
         device: str = "cpu",
+        max_context_tokens: int = 8192,
+        gemini_context_tokens: int = 1_000_000,
     ):
         self._model_size = model_size
+        # Prompt + generated-token budget per backend; callers trim inputs to
+        # stay inside context_tokens
+        self.max_context_tokens = max_context_tokens
+        self.gemini_context_tokens = gemini_context_tokens
         self._hf_token = hf_token
         self._gemini_api_key = gemini_api_key
         self._device = device
         self._model = None
         self._tokenizer = None
+        self._ping_ok = True
+        self._ping_at: Optional[float] = None
+        # prompt -> tokenized inputs (CPU tensors), most recently used last
+        self._encoded: "OrderedDict[str, Any]" = OrderedDict()
+        self._encoded_lock = threading.Lock()  # analyze_all encodes from two threads
+
+    # ------------------------------------------------------------------
+    def ping(self) -> bool:
+        """
+        Cheaply check that the Gemini API key is still accepted.
+
+        Only an auth rejection counts as a failure; network errors and a
+        client without a key report True.  The result is cached for
+        ``_PING_TTL_S`` seconds.
+        """
+        if not self._gemini_api_key:
+            return True
+        now = time.monotonic()
+        if self._ping_at is None or now - self._ping_at >= _PING_TTL_S:
+            self._ping_ok = _gemini_key_accepted(self._gemini_api_key, "gemini-2.0-flash")
+            self._ping_at = now
+        return self._ping_ok
+
+    # ------------------------------------------------------------------
+    @property
+    def context_tokens(self) -> int:
+        """Context budget of the backend :meth:`generate` will try first."""
+        if self._gemini_api_key:
+            return self.gemini_context_tokens
+        return self.max_context_tokens
+
+    # ------------------------------------------------------------------
+    def count_tokens(self, text: str) -> int:
+        """
+        Token count of *text*: exact once the local tokenizer is loaded,
+        otherwise the usual ~4 characters per token estimate.
+        """
+        if self._tokenizer is not None:
+            return len(self._tokenizer.encode(text, add_special_tokens=False))
+        return len(text) // 4
 
     # ------------------------------------------------------------------
     def _load_local(self) -> None:
         if self._model is not None:
             return
-        from transformers import AutoTokenizer, AutoModelForCausalLM  # type: ignore
         import torch  # type: ignore
 
         model_id = self.MODELS.get(self._model_size, self.MODELS["4b"])
-        logger.info("Loading %s…", model_id)
-        kwargs: Dict[str, Any] = {"torch_dtype": "auto"}
-        if self._hf_token:
-            kwargs["token"] = self._hf_token
-
-        self._tokenizer = AutoTokenizer.from_pretrained(
-            model_id, **{"token": self._hf_token} if self._hf_token else {}
-        )
-        self._model = AutoModelForCausalLM.from_pretrained(
-            model_id, **kwargs
-        ).to(self._device)
-        self._model.eval()
+        self._tokenizer, self._model = _load_medgemma(model_id, self._device, self._hf_token)
         self._torch = torch
-        logger.info("%s loaded on %s", model_id, self._device)
 
     # ------------------------------------------------------------------
     def generate(self, prompt: str, max_new_tokens: int = 1024) -> str:
@@ -153,62 +258,314 @@ class MedGemmaTextClient:
 
         return self._generate_local(prompt, max_new_tokens)
 
+    # ------------------------------------------------------------------
+    def generate_stream(self, prompt: str, max_new_tokens: int = 1024) -> Iterator[str]:
+        """Like :meth:`generate`, but yield text chunks as they are produced."""
+        if self._gemini_api_key:
+            started = False
+            try:
+                for chunk in self._stream_gemini(prompt, max_new_tokens):
+                    started = True
+                    yield chunk
+                return
+            except Exception as exc:
+                if started:
+                    raise
+                logger.warning("Gemini API failed (%s); falling back to local model.", exc)
+
+        yield from self._stream_local(prompt, max_new_tokens)
+
     # ------------------------------------------------------------------
     def _generate_gemini(self, prompt: str, max_tokens: int) -> str:
         import google.generativeai as genai  # type: ignore
 
-        genai.configure(api_key=self._gemini_api_key)
-        model = genai.GenerativeModel("gemini-2.0-flash")
+        model = _gemini_model(self._gemini_api_key, "gemini-2.0-flash")
         resp = model.generate_content(
             prompt,
             generation_config=genai.GenerationConfig(max_output_tokens=max_tokens),
         )
         return resp.text.strip()
 
+    # ------------------------------------------------------------------
+    def _stream_gemini(self, prompt: str, max_tokens: int) -> Iterator[str]:
+        import google.generativeai as genai  # type: ignore
+
+        model = _gemini_model(self._gemini_api_key, "gemini-2.0-flash")
+        resp = model.generate_content(
+            prompt,
+            generation_config=genai.GenerationConfig(max_output_tokens=max_tokens),
+            stream=True,
+        )
+        for chunk in resp:
+            if chunk.text:
+                yield chunk.text
+
+    # ------------------------------------------------------------------
+    def _encode(self, prompt: str) -> Any:
+        """
+        Tokenize *prompt* onto the model device, reusing the tokenization of
+        recently seen prompts (e.g. re-running an analysis on an unchanged
+        transcript).
+        """
+        with self._encoded_lock:
+            inputs = self._encoded.pop(prompt, None)
+        if inputs is None:
+            inputs = self._tokenizer(prompt, return_tensors="pt")
+        with self._encoded_lock:
+            self._encoded[prompt] = inputs
+            if len(self._encoded) > _ENCODED_PROMPTS_MAX:
+                self._encoded.popitem(last=False)
+        # BatchEncoding.to() moves in place; copy so the cache stays on CPU
+        return {k: v.to(self._device) for k, v in inputs.items()}
+
     # ------------------------------------------------------------------
     def _generate_local(self, prompt: str, max_new_tokens: int) -> str:
         import torch  # type: ignore
 
         self._load_local()
-        inputs = self._tokenizer(prompt, return_tensors="pt").to(self._device)
-        with torch.no_grad():
+        inputs = self._encode(prompt)
+        with torch.inference_mode():
             out = self._model.generate(
                 **inputs,
                 max_new_tokens=max_new_tokens,
                 do_sample=False,
+                use_cache=True,
                 pad_token_id=self._tokenizer.eos_token_id,
             )
         new = out[0][inputs["input_ids"].shape[-1] :]
         return self._tokenizer.decode(new, skip_special_tokens=True).strip()
 
+    # ------------------------------------------------------------------
+    def _stream_local(self, prompt: str, max_new_tokens: int) -> Iterator[str]:
+        import torch  # type: ignore
+        from transformers import TextIteratorStreamer  # type: ignore
+
+        self._load_local()
+        inputs = self._encode(prompt)
+        streamer = TextIteratorStreamer(
+            self._tokenizer, skip_prompt=True, skip_special_tokens=True
+        )
+        failure: List[BaseException] = []
+
+        def _run() -> None:
+            try:
+                with torch.inference_mode():
+                    self._model.generate(
+                        **inputs,
+                        max_new_tokens=max_new_tokens,
+                        do_sample=False,
+                        use_cache=True,
+                        pad_token_id=self._tokenizer.eos_token_id,
+                        streamer=streamer,
+                    )
+            except BaseException as exc:
+                failure.append(exc)
+            finally:
+                # Always unblock the consumer, even if generate() failed early
+                streamer.end()
+
+        threading.Thread(target=_run, daemon=True).start()
+        for text in streamer:
+            if text:
+                yield text
+        if failure:
+            raise failure[0]
+
+
+# GenerativeModel instances, shared process-wide so repeated calls reuse the
+# same underlying API client (and its open connections).
+_GEMINI_MODELS: Dict[Tuple[str, str], Any] = {}
+_GEMINI_LOCK = threading.Lock()
+
+
+def _gemini_model(api_key: str, model_name: str) -> Any:
+    """Return a cached ``GenerativeModel`` for *model_name* under *api_key*."""
+    import google.generativeai as genai  # type: ignore
+    from google.ai import generativelanguage as glm  # type: ignore
+
+    key_hash = hashlib.sha1(api_key.encode()).hexdigest()
+    with _GEMINI_LOCK:
+        model = _GEMINI_MODELS.get((key_hash, model_name))
+        if model is None:
+            model = genai.GenerativeModel(model_name)
+            # Bind the client to this key now; one created lazily on the first
+            # call would use whatever key genai.configure() last set globally.
+            model._client = glm.GenerativeServiceClient(client_options={"api_key": api_key})
+            _GEMINI_MODELS[(key_hash, model_name)] = model
+        return model
+
+
+def _gemini_key_accepted(api_key: str, model_name: str) -> bool:
+    """Return False only if the Gemini API rejects *api_key*."""
+    try:
+        from google.api_core import exceptions as gexc  # type: ignore
+    except ImportError:
+        return True
+
+    try:
+        # count_tokens authenticates like generate_content but produces no output
+        _gemini_model(api_key, model_name).count_tokens(
+            "ping", request_options={"timeout": 2}
+        )
+    except (gexc.Unauthenticated, gexc.PermissionDenied):
+        return False
+    except Exception as exc:
+        logger.debug("Gemini ping inconclusive: %s", exc)
+    return True
+
+
+# Loaded (tokenizer, model) pairs, shared by every MedGemmaTextClient in the
+# process so that new clients (e.g. one per Streamlit session) reuse weights.
+_LOCAL_MODELS: Dict[Tuple[str, str, str], Tuple[Any, Any]] = {}
+_LOCAL_MODELS_LOCK = threading.Lock()
+
+
+def _local_dtype(device: str) -> Any:
+    """bf16 where the GPU supports it, fp16 on older GPUs, checkpoint dtype on CPU."""
+    import torch  # type: ignore
+
+    if device.startswith("cuda") and torch.cuda.is_available():
+        return torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+    return "auto"
+
+
+def _load_medgemma(model_id: str, device: str, hf_token: Optional[str]) -> Tuple[Any, Any]:
+    """Load *model_id* on *device* once per process and return (tokenizer, model)."""
+    token_hash = hashlib.sha1((hf_token or "").encode()).hexdigest()
+    key = (model_id, device, token_hash)
+    with _LOCAL_MODELS_LOCK:
+        if key not in _LOCAL_MODELS:
+            from transformers import AutoTokenizer, AutoModelForCausalLM  # type: ignore
+
+            logger.info("Loading %s…", model_id)
+            kwargs: Dict[str, Any] = {
+                "torch_dtype": _local_dtype(device),
+            }
+            if hf_token:
+                kwargs["token"] = hf_token
+
+            tokenizer = AutoTokenizer.from_pretrained(
+                model_id, **{"token": hf_token} if hf_token else {}
+            )
+            try:
+                model = AutoModelForCausalLM.from_pretrained(
+                    model_id, attn_implementation="sdpa", **kwargs
+                )
+            except (ValueError, ImportError) as exc:
+                logger.warning("SDPA attention unavailable (%s); using eager.", exc)
+                model = AutoModelForCausalLM.from_pretrained(model_id, **kwargs)
+            model = model.to(device)
+            model.eval()
+            _LOCAL_MODELS[key] = (tokenizer, model)
+            logger.info("%s loaded on %s", model_id, device)
+        return _LOCAL_MODELS[key]
+
 
 # ── JSON extraction helper ─────────────────────────────────────────────────────
 
 
+_JSON_PATTERNS = (
+    re.compile(r"```json\s*([\s\S]+?)\s*```"),
+    re.compile(r"```\s*([\s\S]+?)\s*```"),
+)
+
+
+def _find_json_object(text: str) -> Optional[str]:
+    """
+    Return the first balanced ``{...}`` span in *text*, or None.
+
+    A single linear scan that tracks brace depth and skips over braces
+    inside JSON string literals.
+    """
+    start = text.find("{")
+    if start == -1:
+        return None
+
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start : i + 1]
+    return None
+
+
 def _extract_json(text: str) -> Optional[Dict]:
     """Extract the first JSON object found in *text*."""
+    # No brace means no object: skip the parse attempts and regex scans
+    if "{" not in text:
+        return None
+
     # Try direct parse first
     try:
-        return json.loads(text)
+        return json_loads(text)
     except json.JSONDecodeError:
         pass
 
     # Find JSON block between ```json ... ``` or { ... }
-    patterns = [
-        r"```json\s*([\s\S]+?)\s*```",
-        r"```\s*([\s\S]+?)\s*```",
-        r"(\{[\s\S]+\})",
-    ]
-    for pat in patterns:
-        match = re.search(pat, text)
+    for pat in _JSON_PATTERNS:
+        match = pat.search(text)
         if match:
             try:
-                return json.loads(match.group(1))
+                return json_loads(match.group(1))
             except json.JSONDecodeError:
                 continue
+
+    obj = _find_json_object(text)
+    if obj is not None:
+        try:
+            return json_loads(obj)
+        except json.JSONDecodeError:
+            pass
     return None
 
 
+# ── Fallback results ───────────────────────────────────────────────────────────
+# Minimal structures returned when the model output can't be parsed, so
+# callers don't crash.
+
+
+def _fallback_diff_dx(raw: str) -> Dict:
+    return {
+        "primary_diagnosis": {
+            "condition": "Unable to parse",
+            "confidence": "low",
+            "reasoning": raw[:_MAX_FALLBACK_REASONING_LENGTH],
+        },
+        "differential_diagnoses": [],
+        "red_flags": [],
+        "urgent_workup": [],
+    }
+
+
+def _fallback_structured(transcript: str) -> Dict:
+    return {
+        "symptoms": [],
+        "radiology_findings": [],
+        "suggested_medications": [],
+        "follow_up_date": "",
+        "vital_signs": {},
+        "allergies": [],
+        "procedures_ordered": [],
+        "diagnoses": [],
+        "physician_notes": transcript[:300],
+    }
+
+
 # ── Clinical Engine ────────────────────────────────────────────────────────────
 
 
@@ -222,6 +579,14 @@ class ClinicalEngine:
 
     def __init__(self, llm: Optional[MedGemmaTextClient] = None):
         self._llm = llm or MedGemmaTextClient()
+        # sha1(prompt) -> generated text for the free-text tasks, LRU order
+        self._memo: "OrderedDict[str, str]" = OrderedDict()
+        self._memo_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    def ping(self) -> bool:
+        """True while the underlying LLM client's credentials are accepted."""
+        return self._llm.ping()
 
     # ------------------------------------------------------------------
     def differential_diagnosis(
@@ -234,27 +599,172 @@ class ClinicalEngine:
 
         Returns a dict with primary_diagnosis and differential_diagnoses.
         """
-        ehr_section = (
-            f"\nPATIENT HISTORY CONTEXT:\n{ehr_summary}" if ehr_summary else ""
+        prompt = self._fit_prompt(self._diff_dx_prompt, transcript, ehr_summary, 1024)
+        raw = self._llm.generate(prompt)
+        return self.parse_differential_diagnosis(raw)
+
+    # ------------------------------------------------------------------
+    def differential_diagnosis_stream(
+        self,
+        transcript: str,
+        ehr_summary: Optional[str] = None,
+    ) -> Iterator[str]:
+        """
+        Stream the raw model output for a differential diagnosis.
+
+        Join the chunks and pass them to :meth:`parse_differential_diagnosis`
+        once the stream is exhausted.
+        """
+        yield from self._llm.generate_stream(
+            self._fit_prompt(self._diff_dx_prompt, transcript, ehr_summary, 1024)
+        )
+
+    # ------------------------------------------------------------------
+    def analyze(self, transcript: str, ehr_summary: Optional[str] = None) -> Dict:
+        """
+        Run differential diagnosis and structured extraction in one LLM call,
+        so the transcript is only prefilled once.
+
+        Returns ``{"diagnosis": <differential_diagnosis dict>,
+        "structured": <extract_structured dict>}``.
+        """
+        raw = self._llm.generate(
+            self._fit_prompt(self._analysis_prompt, transcript, ehr_summary, 1536),
+            max_new_tokens=1536,
         )
-        prompt = _DIFF_DX_PROMPT.format(
-            transcript=transcript.strip(), ehr_context=ehr_section
+        return self.parse_analysis(raw, transcript)
+
+    # ------------------------------------------------------------------
+    def analyze_stream(
+        self,
+        transcript: str,
+        ehr_summary: Optional[str] = None,
+    ) -> Iterator[str]:
+        """
+        Stream the raw model output for :meth:`analyze`.
+
+        Join the chunks and pass them to :meth:`parse_analysis` once the
+        stream is exhausted.
+        """
+        yield from self._llm.generate_stream(
+            self._fit_prompt(self._analysis_prompt, transcript, ehr_summary, 1536),
+            max_new_tokens=1536,
         )
-        raw = self._llm.generate(prompt)
-        result = _extract_json(raw)
 
-        if result is None:
-            # Return a minimal structure so callers don't crash
+    # ------------------------------------------------------------------
+    def analyze_all(
+        self,
+        transcript: str,
+        ehr_summary: Optional[str] = None,
+        image_findings: Optional[str] = None,
+    ) -> Dict:
+        """
+        Run :meth:`analyze` and :meth:`context_aware_suggestion`.
+
+        The two calls are independent, so with the Gemini backend they run
+        concurrently and the wall time is that of the slower one rather than
+        their sum.  The local model runs them one after the other, since two
+        concurrent generate() calls on one model only contend for it.
+        Returns the :meth:`analyze` dict plus a ``"recommendations"`` string.
+        """
+        if not self._llm._gemini_api_key:
+            analysis = self.analyze(transcript, ehr_summary)
             return {
-                "primary_diagnosis": {
-                    "condition": "Unable to parse",
-                    "confidence": "low",
-                    "reasoning": raw[:_MAX_FALLBACK_REASONING_LENGTH],
-                },
-                "differential_diagnoses": [],
-                "red_flags": [],
-                "urgent_workup": [],
+                **analysis,
+                "recommendations": self.context_aware_suggestion(
+                    transcript, ehr_summary, image_findings
+                ),
             }
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            analysis = pool.submit(self.analyze, transcript, ehr_summary)
+            suggestion = pool.submit(
+                self.context_aware_suggestion,
+                transcript,
+                ehr_summary,
+                image_findings,
+            )
+            return {**analysis.result(), "recommendations": suggestion.result()}
+
+    # ------------------------------------------------------------------
+    @staticmethod
+    def parse_analysis(raw: str, transcript: str) -> Dict:
+        """Split raw :meth:`analyze` output into its diagnosis and structured parts."""
+        result = _extract_json(raw)
+        if not isinstance(result, dict):
+            result = {}
+        diagnosis = result.get("diagnosis")
+        structured = result.get("structured")
+        return {
+            "diagnosis": diagnosis if isinstance(diagnosis, dict) else _fallback_diff_dx(raw),
+            "structured": (
+                structured if isinstance(structured, dict) else _fallback_structured(transcript)
+            ),
+        }
+
+    # ------------------------------------------------------------------
+    def _fit_prompt(
+        self,
+        build: Callable[[str, Any], str],
+        transcript: str,
+        ehr_summary: Optional[str],
+        max_new_tokens: int,
+    ) -> str:
+        """
+        Return ``build(transcript, ehr_summary)``, trimmed so the prompt plus
+        *max_new_tokens* fits the LLM's context budget.  The EHR context is
+        cut first, then the end of the transcript.
+        """
+        budget = self._llm.context_tokens - max_new_tokens
+        prompt = build(transcript, ehr_summary)
+        for _ in range(3):
+            tokens = self._llm.count_tokens(prompt)
+            if tokens <= budget:
+                return prompt
+            # Convert the overshoot to characters at this prompt's density
+            cut = -(-(tokens - budget) * len(prompt) // tokens)
+            if ehr_summary:
+                drop = min(cut, len(ehr_summary))
+                ehr_summary = ehr_summary[: len(ehr_summary) - drop]
+                cut -= drop
+            if cut:
+                transcript = transcript[: max(len(transcript) - cut, 0)]
+            logger.warning(
+                "Prompt is ~%d tokens over the %d-token budget; truncating inputs.",
+                tokens - budget,
+                budget,
+            )
+            prompt = build(transcript, ehr_summary)
+        return prompt
+
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _ehr_section(ehr_summary: Optional[str]) -> str:
+        return f"\nPATIENT HISTORY CONTEXT:\n{ehr_summary}" if ehr_summary else ""
+
+    # ------------------------------------------------------------------
+    @classmethod
+    def _diff_dx_prompt(cls, transcript: str, ehr_summary: Optional[str]) -> str:
+        return (
+            f"{_DIFF_DX_PREFIX}{transcript.strip()}\n\n"
+            f"{cls._ehr_section(ehr_summary)}{_DIFF_DX_SUFFIX}"
+        )
+
+    # ------------------------------------------------------------------
+    @classmethod
+    def _analysis_prompt(cls, transcript: str, ehr_summary: Optional[str]) -> str:
+        return (
+            f"{_ANALYSIS_PREFIX}{transcript.strip()}\n\n"
+            f"{cls._ehr_section(ehr_summary)}{_ANALYSIS_SUFFIX}"
+        )
+
+    # ------------------------------------------------------------------
+    @staticmethod
+    def parse_differential_diagnosis(raw: str) -> Dict:
+        """Parse raw model output into the differential diagnosis dict."""
+        result = _extract_json(raw)
+
+        if result is None:
+            return _fallback_diff_dx(raw)
         return result
 
     # ------------------------------------------------------------------
@@ -265,51 +775,104 @@ class ClinicalEngine:
           follow_up_date, vital_signs, allergies, procedures_ordered,
           diagnoses, physician_notes.
         """
-        prompt = _EXTRACTION_PROMPT.format(transcript=transcript.strip())
+        prompt = f"{_EXTRACTION_PREFIX}{transcript.strip()}{_EXTRACTION_SUFFIX}"
         raw = self._llm.generate(prompt)
         result = _extract_json(raw)
 
         if result is None:
-            return {
-                "symptoms": [],
-                "radiology_findings": [],
-                "suggested_medications": [],
-                "follow_up_date": "",
-                "vital_signs": {},
-                "allergies": [],
-                "procedures_ordered": [],
-                "diagnoses": [],
-                "physician_notes": transcript[:300],
-            }
+            return _fallback_structured(transcript)
         return result
 
     # ------------------------------------------------------------------
     def summarize_ehr(self, ehr_text: str) -> str:
         """Produce a concise clinical summary from a raw EHR blob."""
-        prompt = _EHR_SUMMARY_PROMPT.format(ehr_text=ehr_text.strip())
-        return self._llm.generate(prompt, max_new_tokens=300)
+        prompt = f"{_EHR_SUMMARY_PREFIX}{ehr_text.strip()}{_EHR_SUMMARY_SUFFIX}"
+        return self._generate_memo(prompt, max_new_tokens=300)
 
     # ------------------------------------------------------------------
     def context_aware_suggestion(
         self,
         transcript: str,
-        ehr_summary: str,
+        ehr_summary: Optional[str],
         image_findings: Optional[str] = None,
     ) -> str:
         """
         Combine transcript, EHR context, and imaging findings for a
         holistic clinical recommendation.
         """
+        prompt = self._fit_prompt(
+            lambda t, e: self._suggestion_prompt(t, e, image_findings),
+            transcript,
+            ehr_summary,
+            600,
+        )
+        return self._generate_memo(prompt, max_new_tokens=600)
+
+    # ------------------------------------------------------------------
+    def context_aware_suggestion_stream(
+        self,
+        transcript: str,
+        ehr_summary: Optional[str],
+        image_findings: Optional[str] = None,
+    ) -> Iterator[str]:
+        """Like :meth:`context_aware_suggestion`, but yield text as it is generated."""
+        prompt = self._fit_prompt(
+            lambda t, e: self._suggestion_prompt(t, e, image_findings),
+            transcript,
+            ehr_summary,
+            600,
+        )
+        yield from self._stream_memo(prompt, max_new_tokens=600)
+
+    # ------------------------------------------------------------------
+    def _remember(self, key: str, text: str) -> None:
+        with self._memo_lock:
+            self._memo[key] = text
+            self._memo.move_to_end(key)
+            if len(self._memo) > _MEMO_MAX_ENTRIES:
+                self._memo.popitem(last=False)
+
+    # ------------------------------------------------------------------
+    def _generate_memo(self, prompt: str, max_new_tokens: int) -> str:
+        """``self._llm.generate``, answered from memory for a repeated prompt."""
+        key = hashlib.sha1(prompt.encode()).hexdigest()
+        text = self._memo.get(key)
+        if text is None:
+            text = self._llm.generate(prompt, max_new_tokens=max_new_tokens)
+        self._remember(key, text)
+        return text
+
+    # ------------------------------------------------------------------
+    def _stream_memo(self, prompt: str, max_new_tokens: int) -> Iterator[str]:
+        """Streaming :meth:`_generate_memo`; only a fully consumed stream is kept."""
+        key = hashlib.sha1(prompt.encode()).hexdigest()
+        text = self._memo.get(key)
+        if text is not None:
+            self._remember(key, text)
+            yield text
+            return
+        chunks = []
+        for chunk in self._llm.generate_stream(prompt, max_new_tokens=max_new_tokens):
+            chunks.append(chunk)
+            yield chunk
+        self._remember(key, "".join(chunks))
+
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _suggestion_prompt(
+        transcript: str,
+        ehr_summary: Optional[str],
+        image_findings: Optional[str],
+    ) -> str:
         imaging_section = (
             f"\nRADIOLOGY FINDINGS:\n{image_findings}" if image_findings else ""
         )
-        prompt = (
+        return (
             "You are a senior clinician. Given the following information, "
             "provide concise, evidence-based clinical recommendations.\n\n"
             f"ENCOUNTER TRANSCRIPT:\n{transcript}\n\n"
-            f"PATIENT HISTORY:\n{ehr_summary}"
+            f"PATIENT HISTORY:\n{ehr_summary or 'Not provided.'}"
             f"{imaging_section}\n\n"
             "Provide: (1) Top differential diagnoses, (2) Immediate management steps, "
             "(3) Investigations to order, (4) Patient counseling points."
         )
-        return self._llm.generate(prompt, max_new_tokens=600)
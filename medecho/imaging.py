@@ -3,8 +3,13 @@ Medical Imaging Module for MedEcho
 Handles MedSigLIP zero-shot classification and MedGemma 4B multimodal analysis.
 """
 
+import hashlib
 import io
 import logging
+import os
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple, Union
 
@@ -52,20 +57,70 @@ LABEL_SETS: Dict[str, List[str]] = {
 }
 
 
+# Persistent TorchInductor cache, so compiled encoders survive process restarts
+_INDUCTOR_CACHE_DIR = Path.home() / ".cache" / "medecho" / "inductor"
+
+
+def _enable_inductor_cache() -> None:
+    """Point TorchInductor's FX graph cache at :data:`_INDUCTOR_CACHE_DIR`."""
+    os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", str(_INDUCTOR_CACHE_DIR))
+    try:
+        import torch._inductor.config as inductor_config  # type: ignore
+
+        inductor_config.fx_graph_cache = True
+    except (ImportError, AttributeError) as exc:
+        logger.debug("Inductor FX graph cache unavailable: %s", exc)
+
+
+_TORCH_THREADS_SET = False
+
+
+def _limit_torch_threads(torch) -> None:  # type: ignore[no-untyped-def]
+    """Cap intra-op threads once per process so co-loaded models don't oversubscribe."""
+    global _TORCH_THREADS_SET
+    if _TORCH_THREADS_SET:
+        return
+    _TORCH_THREADS_SET = True
+    torch.set_num_threads(min(8, os.cpu_count() or 1))
+
+
 # ── Image loading helper ───────────────────────────────────────────────────────
 
 
+# Recently decoded images, keyed by (path, mtime) or a digest of the bytes, so
+# describe/localize/compare on the same input decode it only once.
+_DECODED: "OrderedDict[Tuple, PIL.Image.Image]" = OrderedDict()  # type: ignore[name-defined]
+_DECODED_MAX = 32
+_DECODED_LOCK = threading.Lock()
+
+
 def load_image(image_input: Union[str, Path, bytes, "PIL.Image.Image"]) -> "PIL.Image.Image":  # type: ignore[name-defined]
     """Load an image from a file path, bytes buffer, or PIL Image."""
     from PIL import Image  # type: ignore
 
     if isinstance(image_input, Image.Image):
-        return image_input.convert("RGB")
+        return image_input if image_input.mode == "RGB" else image_input.convert("RGB")
     if isinstance(image_input, (str, Path)):
-        return Image.open(str(image_input)).convert("RGB")
-    if isinstance(image_input, (bytes, bytearray)):
-        return Image.open(io.BytesIO(image_input)).convert("RGB")
-    raise TypeError(f"Unsupported image type: {type(image_input)}")
+        path = str(image_input)
+        key: Tuple = ("path", path, os.path.getmtime(path))
+        source = path
+    elif isinstance(image_input, (bytes, bytearray)):
+        key = ("bytes", hashlib.blake2b(image_input, digest_size=16).digest())
+        source = io.BytesIO(image_input)
+    else:
+        raise TypeError(f"Unsupported image type: {type(image_input)}")
+
+    with _DECODED_LOCK:
+        img = _DECODED.get(key)
+        if img is not None:
+            _DECODED.move_to_end(key)
+            return img
+    img = Image.open(source).convert("RGB")
+    with _DECODED_LOCK:
+        _DECODED[key] = img
+        if len(_DECODED) > _DECODED_MAX:
+            _DECODED.popitem(last=False)
+    return img
 
 
 # ── MedSigLIP Zero-Shot Classifier ────────────────────────────────────────────
@@ -82,24 +137,66 @@ class MedSigLIPAnalyzer:
 
     MODEL_ID = "google/medsiglip-base-patch16-224"
 
-    def __init__(self, device: str = "cpu"):
+    def __init__(self, device: str = "cpu", compile_encoders: bool = True):
+        """
+        ``compile_encoders`` wraps the vision and text towers in
+        ``torch.compile`` on CUDA devices; CPU stays eager, where compiling
+        tends to cost more than it saves.
+        """
         self._device = device
+        self._compile_encoders = compile_encoders
         self._model = None
         self._processor = None
+        self._load_lock = threading.Lock()
+        # tuple(labels) -> normalised text embeddings on self._device
+        self._text_cache: Dict[Tuple[str, ...], "torch.Tensor"] = {}  # type: ignore[name-defined]
 
     # ------------------------------------------------------------------
     def _load(self) -> None:
         if self._model is not None:
             return
+        # Double-checked: concurrent requests must not load the weights twice
+        with self._load_lock:
+            if self._model is not None:
+                return
+            self._load_locked()
+
+    def _load_locked(self) -> None:
         try:
             from transformers import AutoProcessor, AutoModel  # type: ignore
             import torch  # type: ignore
 
+            from medecho.clinical import _local_dtype
+
+            _limit_torch_threads(torch)
             logger.info("Loading MedSigLIP model…")
             self._processor = AutoProcessor.from_pretrained(self.MODEL_ID)
-            self._model = AutoModel.from_pretrained(self.MODEL_ID).to(self._device)
-            self._model.eval()
+            kwargs: Dict = {"torch_dtype": _local_dtype(self._device)}
+            try:
+                model = AutoModel.from_pretrained(
+                    self.MODEL_ID, attn_implementation="sdpa", **kwargs
+                )
+            except (ValueError, ImportError) as exc:
+                logger.warning("SDPA attention unavailable (%s); using eager.", exc)
+                model = AutoModel.from_pretrained(self.MODEL_ID, **kwargs)
+            model = model.to(self._device)
+            model.eval()
+            on_gpu = self._device.startswith("cuda")
+            if on_gpu:
+                # NHWC weights for the conv patch embedding (cuDNN's preferred layout)
+                model = model.to(memory_format=torch.channels_last)
+            if self._compile_encoders and on_gpu and hasattr(torch, "compile"):
+                _enable_inductor_cache()
+                # Compile each tower separately so preprocessing stays outside the graph
+                model.vision_model = torch.compile(
+                    model.vision_model, mode="reduce-overhead", fullgraph=False
+                )
+                model.text_model = torch.compile(
+                    model.text_model, mode="reduce-overhead", fullgraph=False
+                )
             self._torch = torch
+            # Publish last so the unlocked fast path never sees a half-built model
+            self._model = model
             logger.info("MedSigLIP ready on %s", self._device)
         except Exception as exc:
             logger.error("Failed to load MedSigLIP: %s", exc)
@@ -108,7 +205,7 @@ class MedSigLIPAnalyzer:
     # ------------------------------------------------------------------
     def classify(
         self,
-        image: Union[str, Path, bytes, "PIL.Image.Image"],  # type: ignore[name-defined]
+        image: Union[str, Path, bytes, "PIL.Image.Image", "torch.Tensor"],  # type: ignore[name-defined]
         labels: Optional[List[str]] = None,
         modality: str = "Chest X-Ray",
         top_k: int = 5,
@@ -116,48 +213,195 @@ class MedSigLIPAnalyzer:
         """
         Run zero-shot classification.
 
+        *image* may also be a preprocessed ``pixel_values`` tensor
+        (``(3, H, W)`` or ``(1, 3, H, W)``), which skips the processor.
+
         Returns a sorted list of {label: str, score: float} dicts,
         highest confidence first.
         """
         import torch  # type: ignore
-        import torch.nn.functional as F  # type: ignore
+
+        if isinstance(image, torch.Tensor):
+            batch = image if image.dim() == 4 else image.unsqueeze(0)
+            return self.classify_batch(batch, labels, modality, top_k)[0]
+        return self.classify_batch([image], labels, modality, top_k)[0]
+
+    # ------------------------------------------------------------------
+    def classify_batch(
+        self,
+        images: Union[List[Union[str, Path, bytes, "PIL.Image.Image"]], "torch.Tensor"],  # type: ignore[name-defined]
+        labels: Optional[List[str]] = None,
+        modality: str = "Chest X-Ray",
+        top_k: int = 5,
+        batch_size: int = 32,
+    ) -> List[List[Dict[str, float]]]:
+        """
+        Zero-shot classify several images, running the image tower once per
+        *batch_size* images instead of once per image.
+
+        *images* may also be an already preprocessed ``pixel_values`` tensor
+        of shape ``(B, 3, H, W)``, which skips the processor entirely.
+        Returns one :meth:`classify`-style result list per image.
+        """
+        import torch  # type: ignore
 
         self._load()
 
         if labels is None:
             labels = LABEL_SETS.get(modality, CHEST_XRAY_LABELS)
 
-        pil_img = load_image(image)
+        results: List[List[Dict[str, float]]] = []
+        for start in range(0, len(images), batch_size):
+            chunk = images[start : start + batch_size]
+            if isinstance(chunk, torch.Tensor):
+                pixel_values = chunk
+            else:
+                pixel_values = self._processor(
+                    images=[load_image(img) for img in chunk], return_tensors="pt"
+                )["pixel_values"]
+            results.extend(self._classify_pixel_values(pixel_values, labels, top_k))
+        return results
 
-        # Encode image
-        img_inputs = self._processor(images=pil_img, return_tensors="pt").to(
-            self._device
-        )
+    # ------------------------------------------------------------------
+    def _classify_pixel_values(
+        self,
+        pixel_values: "torch.Tensor",  # type: ignore[name-defined]
+        labels: List[str],
+        top_k: int = 5,
+    ) -> List[List[Dict[str, float]]]:
+        """
+        Classify an already preprocessed ``(B, 3, H, W)`` batch.
+
+        Tensors already on the model's device are used without a copy, so
+        callers holding device-resident batches can call this in a loop.
+        """
+        import torch  # type: ignore
+        import torch.nn.functional as F  # type: ignore
+
+        self._load()
+
+        if self._device.startswith("cuda") and not pixel_values.is_cuda:
+            # Pinned source + async copy: the transfer overlaps the label encoding below
+            pixel_values = pixel_values.pin_memory().to(
+                self._device, dtype=self._model.dtype, non_blocking=True
+            )
+        else:
+            pixel_values = pixel_values.to(self._device, dtype=self._model.dtype)
+        text_features = self._text_features(labels)
+        if pixel_values.is_cuda:
+            pixel_values = pixel_values.contiguous(memory_format=torch.channels_last)
+
+        # Encode images; similarities are computed in fp32 for stability
         with torch.no_grad():
-            img_features = self._model.get_image_features(**img_inputs)
-            img_features = F.normalize(img_features, dim=-1)
+            img_features = self._model.get_image_features(pixel_values=pixel_values)
+            img_features = F.normalize(img_features.float(), dim=-1)
+
+        # Cosine similarities → softmax probabilities, one row per image.
+        # Select the top-k on device and copy scores and indices back in one go.
+        logits = img_features @ text_features.T
+        probs = F.softmax(logits * 100, dim=-1)
+        vals, idx = torch.topk(probs, k=min(top_k, len(labels)), dim=-1)
+        scores, indices = torch.stack((vals, idx.to(vals.dtype))).tolist()
+
+        return [
+            [{"label": labels[int(i)], "score": sc} for i, sc in zip(row_idx, row_scores)]
+            for row_scores, row_idx in zip(scores, indices)
+        ]
+
+    # ------------------------------------------------------------------
+    def _text_features(self, labels: List[str]) -> "torch.Tensor":  # type: ignore[name-defined]
+        """Normalised label embeddings, encoded once per distinct label list."""
+        key = tuple(labels)
+        cached = self._text_cache.get(key)
+        if cached is not None:
+            return cached
+
+        import torch  # type: ignore
+        import torch.nn.functional as F  # type: ignore
 
-        # Encode labels
         text_inputs = self._processor(
             text=labels, return_tensors="pt", padding=True
         ).to(self._device)
         with torch.no_grad():
             text_features = self._model.get_text_features(**text_inputs)
-            text_features = F.normalize(text_features, dim=-1)
+            text_features = F.normalize(text_features.float(), dim=-1)
+        self._text_cache[key] = text_features
+        return text_features
 
-        # Cosine similarities → softmax probabilities
-        logits = (img_features @ text_features.T).squeeze(0)
-        probs = F.softmax(logits * 100, dim=-1).cpu().tolist()
 
-        results = sorted(
-            [{"label": lbl, "score": float(sc)} for lbl, sc in zip(labels, probs)],
-            key=lambda x: x["score"],
-            reverse=True,
-        )
-        return results[:top_k]
+# ── MedGemma 4B Multimodal Analyzer ───────────────────────────────────────────
 
 
-# ── MedGemma 4B Multimodal Analyzer ───────────────────────────────────────────
+def _describe_messages(pil_img: "PIL.Image.Image", modality: str) -> List[Dict]:  # type: ignore[name-defined]
+    return [
+        {
+            "role": "user",
+            "content": [
+                {"type": "image", "image": pil_img},
+                {
+                    "type": "text",
+                    "text": (
+                        f"This is a {modality}. "
+                        "Please provide a detailed, structured radiological report "
+                        "including: (1) Image quality assessment, (2) Key findings, "
+                        "(3) Pertinent negatives, (4) Impression, (5) Recommendations."
+                    ),
+                },
+            ],
+        }
+    ]
+
+
+def _localize_messages(pil_img: "PIL.Image.Image", finding: str) -> List[Dict]:  # type: ignore[name-defined]
+    return [
+        {
+            "role": "user",
+            "content": [
+                {"type": "image", "image": pil_img},
+                {
+                    "type": "text",
+                    "text": (
+                        f"Please identify and describe the anatomical location of "
+                        f'"{finding}" in this image. Be specific about lobe, zone, '
+                        "laterality, and relationship to adjacent structures."
+                    ),
+                },
+            ],
+        }
+    ]
+
+
+def _compare_messages(
+    pil_img: "PIL.Image.Image", prior_report_text: str, modality: str  # type: ignore[name-defined]
+) -> List[Dict]:
+    return [
+        {
+            "role": "user",
+            "content": [
+                {"type": "image", "image": pil_img},
+                {
+                    "type": "text",
+                    "text": (
+                        f"This is a current {modality}. "
+                        f"The prior report states:\n\n{prior_report_text}\n\n"
+                        "Please compare the current image with the prior report. "
+                        "Describe: (1) Interval changes, (2) Stable findings, "
+                        "(3) New findings, (4) Resolved findings, (5) Overall impression."
+                    ),
+                },
+            ],
+        }
+    ]
+
+
+def _message_images(messages: List[Dict]) -> List:
+    """Images referenced by a chat-template message list, in order."""
+    return [
+        part["image"]
+        for m in messages
+        for part in m.get("content", [])
+        if isinstance(part, dict) and part.get("type") == "image"
+    ]
 
 
 class MedGemmaImageAnalyzer:
@@ -181,35 +425,77 @@ class MedGemmaImageAnalyzer:
         "if appropriate. Use standard radiological terminology."
     )
 
-    def __init__(self, hf_token: Optional[str] = None, device: str = "cpu"):
+    def __init__(
+        self,
+        hf_token: Optional[str] = None,
+        device: str = "cpu",
+        compile_model: bool = True,
+    ):
+        """``compile_model`` wraps the forward pass in ``torch.compile`` on CUDA devices."""
         self._hf_token = hf_token
         self._device = device
+        self._compile_model = compile_model
         self._model = None
         self._processor = None
+        self._load_lock = threading.Lock()
 
     # ------------------------------------------------------------------
     def _load(self) -> None:
         if self._model is not None:
             return
+        with self._load_lock:
+            if self._model is not None:
+                return
+            self._load_locked()
+
+    def _load_locked(self) -> None:
         try:
             from transformers import AutoProcessor, AutoModelForImageTextToText  # type: ignore
             import torch  # type: ignore
 
+            from medecho.clinical import _local_dtype
+
+            _limit_torch_threads(torch)
             logger.info("Loading MedGemma 4B model…")
             kwargs: Dict = {
                 "trust_remote_code": True,
-                "torch_dtype": "auto",
+                "torch_dtype": _local_dtype(self._device),
             }
             if self._hf_token:
                 kwargs["token"] = self._hf_token
+            # On GPU let accelerate place the weights (and spill if VRAM is short)
+            on_gpu = self._device.startswith("cuda")
+            if on_gpu:
+                kwargs["device_map"] = "auto"
 
             self._processor = AutoProcessor.from_pretrained(
                 self.MODEL_ID, **{"token": self._hf_token} if self._hf_token else {}
             )
-            self._model = AutoModelForImageTextToText.from_pretrained(
-                self.MODEL_ID, **kwargs
-            ).to(self._device)
+            # Left padding keeps every batched prompt flush against its
+            # generated tokens (see _generate_batch); single prompts don't pad
+            self._processor.tokenizer.padding_side = "left"
+            try:
+                model = AutoModelForImageTextToText.from_pretrained(
+                    self.MODEL_ID, attn_implementation="sdpa", **kwargs
+                )
+            except (ValueError, ImportError) as exc:
+                logger.warning("SDPA attention unavailable (%s); using eager.", exc)
+                model = AutoModelForImageTextToText.from_pretrained(
+                    self.MODEL_ID, **kwargs
+                )
+            if not on_gpu:
+                model = model.to(self._device)
+            model.eval()
+            if self._compile_model and on_gpu and hasattr(torch, "compile"):
+                _enable_inductor_cache()
+                # Variable prompt lengths: dynamic shapes and a larger
+                # recompile budget keep dynamo from thrashing.
+                torch._dynamo.config.cache_size_limit = 64
+                model.forward = torch.compile(
+                    model.forward, mode="reduce-overhead", dynamic=True
+                )
             self._torch = torch
+            self._model = model
             logger.info("MedGemma 4B ready on %s", self._device)
         except Exception as exc:
             logger.error("Failed to load MedGemma 4B: %s", exc)
@@ -227,20 +513,57 @@ class MedGemmaImageAnalyzer:
         )
         inputs = self._processor(
             text=formatted,
-            images=[m["image"] for m in messages if "image" in m],
+            images=_message_images(messages),
             return_tensors="pt",
-        ).to(self._device)
+        ).to(self._model.device, dtype=self._model.dtype)
 
-        with torch.no_grad():
+        with torch.inference_mode():
             output_ids = self._model.generate(
                 **inputs,
                 max_new_tokens=max_new_tokens,
                 do_sample=False,
+                use_cache=True,
             )
 
         new_tokens = output_ids[0][inputs["input_ids"].shape[-1] :]
         return self._processor.decode(new_tokens, skip_special_tokens=True).strip()
 
+    # ------------------------------------------------------------------
+    def _generate_batch(
+        self, messages_list: List[List[Dict]], max_new_tokens: int = 512
+    ) -> List[str]:
+        """Run several prompts through a single left-padded ``generate()`` call."""
+        import torch  # type: ignore
+
+        self._load()
+
+        texts = [
+            self._processor.apply_chat_template(
+                messages, tokenize=False, add_generation_prompt=True
+            )
+            for messages in messages_list
+        ]
+        inputs = self._processor(
+            text=texts,
+            images=[_message_images(messages) for messages in messages_list],
+            padding=True,
+            return_tensors="pt",
+        ).to(self._model.device, dtype=self._model.dtype)
+
+        with torch.inference_mode():
+            output_ids = self._model.generate(
+                **inputs,
+                max_new_tokens=max_new_tokens,
+                do_sample=False,
+                use_cache=True,
+            )
+
+        new_tokens = output_ids[:, inputs["input_ids"].shape[-1] :]
+        return [
+            text.strip()
+            for text in self._processor.batch_decode(new_tokens, skip_special_tokens=True)
+        ]
+
     # ------------------------------------------------------------------
     def describe(
         self,
@@ -248,25 +571,7 @@ class MedGemmaImageAnalyzer:
         modality: str = "Chest X-Ray",
     ) -> str:
         """Generate a detailed radiological description of the image."""
-        pil_img = load_image(image)
-        messages = [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "image", "image": pil_img},
-                    {
-                        "type": "text",
-                        "text": (
-                            f"This is a {modality}. "
-                            "Please provide a detailed, structured radiological report "
-                            "including: (1) Image quality assessment, (2) Key findings, "
-                            "(3) Pertinent negatives, (4) Impression, (5) Recommendations."
-                        ),
-                    },
-                ],
-            }
-        ]
-        return self._generate(messages)
+        return self._generate(_describe_messages(load_image(image), modality))
 
     # ------------------------------------------------------------------
     def localize(
@@ -275,24 +580,7 @@ class MedGemmaImageAnalyzer:
         finding: str,
     ) -> str:
         """Anatomical localization – describe *where* a finding is in the image."""
-        pil_img = load_image(image)
-        messages = [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "image", "image": pil_img},
-                    {
-                        "type": "text",
-                        "text": (
-                            f"Please identify and describe the anatomical location of "
-                            f'"{finding}" in this image. Be specific about lobe, zone, '
-                            "laterality, and relationship to adjacent structures."
-                        ),
-                    },
-                ],
-            }
-        ]
-        return self._generate(messages)
+        return self._generate(_localize_messages(load_image(image), finding))
 
     # ------------------------------------------------------------------
     def compare_with_prior(
@@ -305,26 +593,30 @@ class MedGemmaImageAnalyzer:
         Longitudinal comparison: analyse the current scan in the context
         of a prior radiology report.
         """
-        pil_img = load_image(current_image)
-        messages = [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "image", "image": pil_img},
-                    {
-                        "type": "text",
-                        "text": (
-                            f"This is a current {modality}. "
-                            f"The prior report states:\n\n{prior_report_text}\n\n"
-                            "Please compare the current image with the prior report. "
-                            "Describe: (1) Interval changes, (2) Stable findings, "
-                            "(3) New findings, (4) Resolved findings, (5) Overall impression."
-                        ),
-                    },
-                ],
-            }
-        ]
-        return self._generate(messages)
+        return self._generate(
+            _compare_messages(load_image(current_image), prior_report_text, modality)
+        )
+
+    # ------------------------------------------------------------------
+    def analyze_all(
+        self,
+        image: Union[str, Path, bytes, "PIL.Image.Image"],  # type: ignore[name-defined]
+        modality: str = "Chest X-Ray",
+        finding: Optional[str] = None,
+        prior: Optional[str] = None,
+        max_new_tokens: int = 512,
+    ) -> Dict[str, str]:
+        """
+        Full workup in one batched ``generate()``: always ``"describe"``, plus
+        ``"localize"`` when *finding* is given and ``"compare"`` when *prior* is.
+        """
+        pil_img = load_image(image)
+        batch = {"describe": _describe_messages(pil_img, modality)}
+        if finding:
+            batch["localize"] = _localize_messages(pil_img, finding)
+        if prior:
+            batch["compare"] = _compare_messages(pil_img, prior, modality)
+        return dict(zip(batch, self._generate_batch(list(batch.values()), max_new_tokens)))
 
     # ------------------------------------------------------------------
     def interpret_volume(
@@ -366,20 +658,53 @@ class GeminiVisionClient:
     def __init__(self, api_key: str, model_name: str = "gemini-2.0-flash"):
         self._api_key = api_key
         self._model_name = model_name
+        self._ping_ok = True
+        self._ping_at: Optional[float] = None
+
+    def ping(self) -> bool:
+        """
+        Cheaply check that the API key is still accepted (cached for
+        ``_PING_TTL_S`` seconds).  Network errors report True.
+        """
+        from medecho.clinical import _PING_TTL_S, _gemini_key_accepted
+
+        now = time.monotonic()
+        if self._ping_at is None or now - self._ping_at >= _PING_TTL_S:
+            self._ping_ok = _gemini_key_accepted(self._api_key, self._model_name)
+            self._ping_at = now
+        return self._ping_ok
+
+    def _image_part(self, image_bytes: bytes):
+        """
+        Inline-data part for *image_bytes*.  Common formats are uploaded as-is
+        with their MIME type; anything else is decoded with PIL first.
+        """
+        mime = _sniff_image_mime(image_bytes)
+        if mime is not None:
+            return {"mime_type": mime, "data": image_bytes}
+        return load_image(image_bytes)
 
     def analyze(self, image_bytes: bytes, prompt: str) -> str:
-        """Send an image + prompt to Gemini and return the response."""
-        try:
-            import google.generativeai as genai  # type: ignore
+        """Send an image + prompt to Gemini and return the response; API errors propagate."""
+        from medecho.clinical import _gemini_model
 
-            genai.configure(api_key=self._api_key)
-            model = genai.GenerativeModel(self._model_name)
+        model = _gemini_model(self._api_key, self._model_name)
+        response = model.generate_content([prompt, self._image_part(image_bytes)])
+        return response.text.strip()
 
-            from PIL import Image  # type: ignore
 
-            pil_img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-            response = model.generate_content([prompt, pil_img])
-            return response.text.strip()
-        except Exception as exc:
-            logger.error("Gemini API call failed: %s", exc)
-            return f"[Analysis unavailable: {exc}]"
+# Leading magic bytes of the formats Gemini accepts as inline image data
+_IMAGE_MAGIC = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+)
+
+
+def _sniff_image_mime(data: bytes) -> Optional[str]:
+    """MIME type of *data* from its magic bytes, or None if not recognised."""
+    for magic, mime in _IMAGE_MAGIC:
+        if data.startswith(magic):
+            return mime
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return None
@@ -3,18 +3,23 @@ Offline Fallback Module for MedEcho
 Manages local storage of audio and images when internet connectivity is lost.
 """
 
+import errno
 import json
 import logging
 import os
-import shutil
+import selectors
 import socket
+import threading
 import time
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Union
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from ._json import json_dumps, json_loads
 
 logger = logging.getLogger(__name__)
 
+
 # ── Connectivity check ─────────────────────────────────────────────────────────
 
 _CHECK_HOSTS = [
@@ -24,20 +29,59 @@ _CHECK_HOSTS = [
 _TIMEOUT_S = 2.0
 
 
+# connect_ex() results that mean "connection in progress" on a non-blocking socket
+_CONNECT_PENDING = {
+    errno.EINPROGRESS,
+    errno.EWOULDBLOCK,
+    errno.EALREADY,
+    getattr(errno, "WSAEWOULDBLOCK", errno.EWOULDBLOCK),
+}
+
+
 def is_online() -> bool:
-    """Return True if internet connectivity is available."""
-    for host, port in _CHECK_HOSTS:
-        try:
-            socket.setdefaulttimeout(_TIMEOUT_S)
-            with socket.create_connection((host, port)):
+    """
+    Return True if internet connectivity is available.
+
+    All hosts are probed in parallel with non-blocking connects; the first
+    one to succeed answers, and the whole check is bounded by ``_TIMEOUT_S``.
+    """
+    sel = selectors.DefaultSelector()
+    socks: List[socket.socket] = []
+    try:
+        for host, port in _CHECK_HOSTS:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setblocking(False)
+            socks.append(sock)
+            err = sock.connect_ex((host, port))
+            if err == 0:
                 return True
-        except OSError:
-            continue
-    return False
+            if err in _CONNECT_PENDING:
+                sel.register(sock, selectors.EVENT_WRITE)
+
+        deadline = time.monotonic() + _TIMEOUT_S
+        while sel.get_map():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            for key, _ in sel.select(remaining):
+                sock = key.fileobj
+                if sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0:
+                    return True
+                sel.unregister(sock)
+        return False
+    except OSError:
+        return False
+    finally:
+        sel.close()
+        for sock in socks:
+            sock.close()
 
 
 # ── Offline Store ──────────────────────────────────────────────────────────────
 
+# Saved encounter sessions untouched for this long are deleted by sweep_sessions
+_SESSION_TTL_S = 24 * 60 * 60
+
 
 class OfflineStore:
     """
@@ -50,6 +94,7 @@ class OfflineStore:
             images/       uploaded medical images
             metadata/     JSON metadata per encounter
             processed/    encounters successfully uploaded/processed
+            sessions/     in-progress UI state, restored after a restart
     """
 
     def __init__(self, base_dir: Union[str, Path] = "offline_data"):
@@ -58,8 +103,15 @@ class OfflineStore:
         self._image_dir = self._base / "images"
         self._meta_dir = self._base / "metadata"
         self._proc_dir = self._base / "processed"
+        self._session_dir = self._base / "sessions"
 
-        for d in (self._audio_dir, self._image_dir, self._meta_dir, self._proc_dir):
+        for d in (
+            self._audio_dir,
+            self._image_dir,
+            self._meta_dir,
+            self._proc_dir,
+            self._session_dir,
+        ):
             d.mkdir(parents=True, exist_ok=True)
 
     # ------------------------------------------------------------------
@@ -71,7 +123,7 @@ class OfflineStore:
         """Persist raw WAV audio for later processing."""
         eid = encounter_id or self._ts()
         path = self._audio_dir / f"{eid}.wav"
-        path.write_bytes(wav_bytes)
+        _write_streamed(path, wav_bytes)
         logger.info("Offline audio saved → %s", path)
         return path
 
@@ -85,7 +137,7 @@ class OfflineStore:
         """Persist a medical image for later analysis."""
         eid = encounter_id or self._ts()
         path = self._image_dir / f"{eid}{suffix}"
-        path.write_bytes(image_bytes)
+        _write_streamed(path, image_bytes)
         logger.info("Offline image saved → %s", path)
         return path
 
@@ -94,17 +146,56 @@ class OfflineStore:
         """Persist encounter metadata as JSON."""
         eid = encounter_id or self._ts()
         path = self._meta_dir / f"{eid}.json"
-        path.write_text(json.dumps(metadata, indent=2, ensure_ascii=False), encoding="utf-8")
+        path.write_bytes(json_dumps(metadata, indent=True))
         logger.info("Offline metadata saved → %s", path)
         return path
 
+    # ------------------------------------------------------------------
+    def save_session(self, session_id: str, state: Dict) -> Path:
+        """Persist in-progress encounter state so it survives a server restart."""
+        path = self._session_dir / f"{session_id}.json"
+        path.write_bytes(json_dumps(state))
+        return path
+
+    # ------------------------------------------------------------------
+    def load_session(self, session_id: str) -> Optional[Dict]:
+        """Return state saved by :meth:`save_session`, or None if there is none."""
+        path = self._session_dir / f"{session_id}.json"
+        try:
+            return json_loads(path.read_bytes())
+        except FileNotFoundError:
+            return None
+        except (OSError, json.JSONDecodeError) as exc:
+            logger.warning("Could not read %s: %s", path, exc)
+            return None
+
+    # ------------------------------------------------------------------
+    def delete_session(self, session_id: str) -> None:
+        """Remove state saved by :meth:`save_session`, if any."""
+        (self._session_dir / f"{session_id}.json").unlink(missing_ok=True)
+
+    # ------------------------------------------------------------------
+    def sweep_sessions(self, max_age_s: float = _SESSION_TTL_S) -> None:
+        """Delete saved sessions that have not been written for *max_age_s* seconds."""
+        cutoff = time.time() - max_age_s
+        with os.scandir(self._session_dir) as it:
+            for entry in it:
+                try:
+                    if entry.is_file() and entry.stat().st_mtime < cutoff:
+                        os.unlink(entry.path)
+                except OSError:
+                    pass
+
     # ------------------------------------------------------------------
     def list_pending(self) -> List[Dict]:
         """Return a list of pending offline encounters (not yet processed)."""
         pending = []
-        for meta_file in sorted(self._meta_dir.glob("*.json")):
+        with os.scandir(self._meta_dir) as it:
+            names = sorted(e.name for e in it if e.name.endswith(".json"))
+        for name in names:
+            meta_file = self._meta_dir / name
             try:
-                data = json.loads(meta_file.read_text(encoding="utf-8"))
+                data = json_loads(meta_file.read_bytes())
                 data["_meta_path"] = str(meta_file)
                 pending.append(data)
             except Exception as exc:
@@ -114,28 +205,91 @@ class OfflineStore:
     # ------------------------------------------------------------------
     def mark_processed(self, encounter_id: str) -> None:
         """Move processed metadata to the 'processed' subdirectory."""
-        src = self._meta_dir / f"{encounter_id}.json"
-        if src.exists():
-            dst = self._proc_dir / src.name
-            shutil.move(str(src), str(dst))
-            logger.info("Encounter %s marked as processed.", encounter_id)
+        name = f"{encounter_id}.json"
+        try:
+            # Same base_dir, same filesystem: a single atomic rename
+            os.replace(self._meta_dir / name, self._proc_dir / name)
+        except FileNotFoundError:
+            return
+        _fsync_dir(self._proc_dir)
+        logger.info("Encounter %s marked as processed.", encounter_id)
 
     # ------------------------------------------------------------------
     def get_stats(self) -> Dict:
-        """Return storage statistics."""
+        """Return storage statistics, gathered in a single directory walk."""
+        meta, audio, images, proc = (
+            str(d) for d in (self._meta_dir, self._audio_dir, self._image_dir, self._proc_dir)
+        )
+        pending = audio_files = image_files = processed = 0
+        total_bytes = 0
+        for parent, entry in _scan_tree(str(self._base)):
+            if entry.is_file():
+                total_bytes += entry.stat().st_size
+            if parent == meta:
+                pending += entry.name.endswith(".json")
+            elif parent == audio:
+                audio_files += entry.name.endswith(".wav")
+            elif parent == images:
+                image_files += 1
+            elif parent == proc:
+                processed += entry.name.endswith(".json")
         return {
-            "pending_encounters": len(list(self._meta_dir.glob("*.json"))),
-            "offline_audio_files": len(list(self._audio_dir.glob("*.wav"))),
-            "offline_images": len(list(self._image_dir.glob("*"))),
-            "processed_encounters": len(list(self._proc_dir.glob("*.json"))),
-            "total_size_mb": round(
-                sum(f.stat().st_size for f in self._base.rglob("*") if f.is_file())
-                / (1024 * 1024),
-                2,
-            ),
+            "pending_encounters": pending,
+            "offline_audio_files": audio_files,
+            "offline_images": image_files,
+            "processed_encounters": processed,
+            "total_size_mb": round(total_bytes / (1024 * 1024), 2),
         }
 
 
+_WRITE_CHUNK_BYTES = 1 << 20
+
+
+def _write_streamed(path: Path, data: bytes) -> None:
+    """
+    Write *data* in 1 MiB chunks, then ask the kernel to drop the written
+    pages so long recordings don't linger in the page cache on edge devices.
+    """
+    view = memoryview(data)
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0)
+    fd = os.open(path, flags, 0o644)
+    try:
+        for start in range(0, len(view), _WRITE_CHUNK_BYTES):
+            chunk = view[start : start + _WRITE_CHUNK_BYTES]
+            while chunk:
+                chunk = chunk[os.write(fd, chunk) :]
+        if len(view) >= _WRITE_CHUNK_BYTES and hasattr(os, "posix_fadvise"):
+            # Dirty pages can't be dropped, so write them back first
+            os.fdatasync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+def _fsync_dir(path: Path) -> None:
+    """Flush a directory entry change (e.g. a rename) to disk, where supported."""
+    if not hasattr(os, "O_DIRECTORY"):
+        return  # e.g. Windows, where directories can't be opened this way
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _scan_tree(path: str) -> Iterator[Tuple[str, os.DirEntry]]:
+    """Yield ``(parent_dir, entry)`` for everything below *path*, depth first."""
+    try:
+        with os.scandir(path) as it:
+            entries = list(it)
+    except OSError:
+        return
+    for entry in entries:
+        yield path, entry
+        if entry.is_dir(follow_symlinks=False):
+            yield from _scan_tree(entry.path)
+
+
 # ── Connection Monitor ─────────────────────────────────────────────────────────
 
 
@@ -155,25 +309,24 @@ class ConnectionMonitor:
         self._on_online = on_online or (lambda: None)
         self._on_offline = on_offline or (lambda: None)
         self._last_state: Optional[bool] = None
-        self._running = False
+        self._stop_evt = threading.Event()
 
     # ------------------------------------------------------------------
     def start(self) -> None:
         """Start monitoring in a daemon thread."""
-        import threading
-
-        self._running = True
+        self._stop_evt.clear()
         thread = threading.Thread(target=self._loop, daemon=True)
         thread.start()
         logger.info("ConnectionMonitor started (poll interval: %ss)", self._interval)
 
     # ------------------------------------------------------------------
     def stop(self) -> None:
-        self._running = False
+        """Stop monitoring; the thread exits at once rather than after its sleep."""
+        self._stop_evt.set()
 
     # ------------------------------------------------------------------
     def _loop(self) -> None:
-        while self._running:
+        while not self._stop_evt.is_set():
             current = is_online()
             if current != self._last_state:
                 if current:
@@ -183,4 +336,5 @@ class ConnectionMonitor:
                     logger.warning("Connection lost – switching to offline mode.")
                     self._on_offline()
                 self._last_state = current
-            time.sleep(self._interval)
+            if self._stop_evt.wait(self._interval):
+                break
@@ -10,37 +10,52 @@ import logging
 import os
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Optional, Union
+from typing import BinaryIO, Dict, Optional, Union
+
+from ._json import json_dumps, json_loads
 
 logger = logging.getLogger(__name__)
 
+
 # ── Encrypted JSON Exporter ────────────────────────────────────────────────────
 
+# Plaintext bytes handed to the cipher per update() in export_to_file
+_STREAM_CHUNK_BYTES = 1 << 20
+
 
 class EncryptedJSONExporter:
     """
     Serialises a clinical encounter to JSON and optionally encrypts it
-    using AES-256-GCM via the `cryptography` library (Fernet symmetric key).
+    using AES-256-GCM via the `cryptography` library.
+
+    Encrypted output is ``nonce (12 bytes) || ciphertext || tag (16 bytes)``,
+    authenticated with the associated data :attr:`AAD`.
 
     Key management:
-      - A new random 256-bit key is generated per session.
+      - A new random 256-bit key is generated per exporter; the app keeps
+        one exporter per user session.
       - The key can be saved alongside the file (for demo purposes) or
         shared via a secure channel.
     """
 
+    AAD = b"medecho-v1"
+    NONCE_BYTES = 12
+
     def __init__(self, key: Optional[bytes] = None):
         """
         Parameters
         ----------
         key : bytes, optional
-            32-byte (256-bit) Fernet key.  If None, a new key is generated.
+            32-byte (256-bit) AES key, raw or as the URL-safe base64 string
+            shown by :attr:`key_b64`.  If None, a new key is generated.
         """
         try:
-            from cryptography.fernet import Fernet  # type: ignore
+            from cryptography.hazmat.primitives.ciphers.aead import AESGCM  # type: ignore
 
-            self._Fernet = Fernet
-            self._key = key or Fernet.generate_key()
-            self._fernet = Fernet(self._key)
+            if key is not None and len(key) != 32:
+                key = base64.urlsafe_b64decode(key)
+            self._key = key or AESGCM.generate_key(bit_length=256)
+            self._aead = AESGCM(self._key)
             self._available = True
         except ImportError:
             logger.warning(
@@ -65,7 +80,7 @@ class EncryptedJSONExporter:
     @property
     def key_b64(self) -> str:
         """Base64-encoded key string, safe to display in UI."""
-        return self._key.decode() if self._key else ""
+        return base64.urlsafe_b64encode(self._key).decode() if self._key else ""
 
     # ------------------------------------------------------------------
     def export(
@@ -80,18 +95,12 @@ class EncryptedJSONExporter:
         Returns the raw bytes (encrypted or plain JSON).
         Writes to *output_path* if given.
         """
-        # Add export metadata
-        payload = {
-            "medecho_version": "1.0.0",
-            "exported_at": datetime.utcnow().isoformat() + "Z",
-            "encrypted": encrypt and self._available,
-            **encounter_data,
-        }
-
-        json_bytes = json.dumps(payload, indent=2, ensure_ascii=False).encode("utf-8")
+        payload = self._payload(encounter_data, encrypt)
+        json_bytes = json_dumps(payload, indent=True)
 
         if encrypt and self._available:
-            data = self._fernet.encrypt(json_bytes)
+            nonce = os.urandom(self.NONCE_BYTES)
+            data = nonce + self._aead.encrypt(nonce, json_bytes, self.AAD)
         else:
             data = json_bytes
 
@@ -101,23 +110,75 @@ class EncryptedJSONExporter:
 
         return data
 
+    # ------------------------------------------------------------------
+    def export_to_file(
+        self,
+        encounter_data: Dict,
+        output_path: Union[str, Path],
+        encrypt: bool = True,
+    ) -> Path:
+        """
+        Like :meth:`export`, but encrypt straight into *output_path* in
+        ``_STREAM_CHUNK_BYTES`` pieces instead of building the whole
+        ciphertext in memory.  The file format is identical.
+        """
+        json_bytes = json_dumps(self._payload(encounter_data, encrypt), indent=True)
+        path = Path(output_path)
+        with path.open("wb") as fh:
+            if encrypt and self._available:
+                self._encrypt_into(fh, json_bytes)
+            else:
+                fh.write(json_bytes)
+        logger.info("Encounter saved → %s", path)
+        return path
+
+    # ------------------------------------------------------------------
+    def _payload(self, encounter_data: Dict, encrypt: bool) -> Dict:
+        """*encounter_data* with export metadata added."""
+        return {
+            "medecho_version": "1.0.0",
+            "exported_at": datetime.utcnow().isoformat() + "Z",
+            "encrypted": encrypt and self._available,
+            **encounter_data,
+        }
+
+    # ------------------------------------------------------------------
+    def _encrypt_into(self, fh: BinaryIO, plaintext: bytes) -> None:
+        """Write ``nonce || AES-GCM(plaintext) || tag`` to *fh* chunk by chunk."""
+        from cryptography.hazmat.primitives.ciphers import (  # type: ignore
+            Cipher,
+            algorithms,
+            modes,
+        )
+
+        nonce = os.urandom(self.NONCE_BYTES)
+        encryptor = Cipher(algorithms.AES(self._key), modes.GCM(nonce)).encryptor()
+        encryptor.authenticate_additional_data(self.AAD)
+        fh.write(nonce)
+        view = memoryview(plaintext)
+        for start in range(0, len(view), _STREAM_CHUNK_BYTES):
+            fh.write(encryptor.update(view[start : start + _STREAM_CHUNK_BYTES]))
+        fh.write(encryptor.finalize())
+        fh.write(encryptor.tag)
+
     # ------------------------------------------------------------------
     def decrypt(self, data: bytes) -> Dict:
         """Decrypt and deserialise an encrypted encounter file."""
         if not self._available:
             try:
-                return json.loads(data)
+                return json_loads(data)
             except (json.JSONDecodeError, UnicodeDecodeError) as exc:
                 raise ValueError(
                     "Data appears to be encrypted but the cryptography library is not "
                     "installed. Install it with: pip install cryptography"
                 ) from exc
-        return json.loads(self._fernet.decrypt(data))
+        nonce, ciphertext = data[: self.NONCE_BYTES], data[self.NONCE_BYTES :]
+        return json_loads(self._aead.decrypt(nonce, ciphertext, self.AAD))
 
     # ------------------------------------------------------------------
     def export_key_file(self, path: Union[str, Path]) -> None:
-        """Write the encryption key to a separate file (for demo/hand-off)."""
-        Path(path).write_bytes(self._key)
+        """Write the encryption key (base64) to a separate file (for demo/hand-off)."""
+        Path(path).write_text(self.key_b64, encoding="ascii")
         logger.info("Encryption key saved → %s", path)
 
 
@@ -133,18 +194,20 @@ class QRCodeGenerator:
     """
 
     MAX_QR_BYTES = 2953  # QR version 40, error correction L
+    # Formats generate_bytes can write (segno serialisers with colour support)
+    FORMATS = ("PNG", "SVG", "PDF", "EPS")
 
     def __init__(self):
         self._available = False
         try:
-            import qrcode  # type: ignore
+            import segno  # type: ignore
 
-            self._qrcode = qrcode
+            self._segno = segno
             self._available = True
         except ImportError:
             logger.warning(
-                "qrcode not installed – QR generation disabled. "
-                "Install with: pip install qrcode[pil]"
+                "segno not installed – QR generation disabled. "
+                "Install with: pip install segno"
             )
 
     # ------------------------------------------------------------------
@@ -167,6 +230,24 @@ class QRCodeGenerator:
             "physician": encounter_data.get("physician", ""),
         }
 
+    # ------------------------------------------------------------------
+    def _make(
+        self,
+        encounter_data: Dict,
+        compact: bool = True,
+        error_correction: str = "M",
+    ):
+        """Build the ``segno`` QR code for *encounter_data*."""
+        # Serialised once to bytes; only an oversized full payload is redone
+        # as the compact summary (re-serialising the summary would not shrink it).
+        summary = self._compact_summary(encounter_data)
+        payload = json_dumps(summary if compact else encounter_data)
+        if not compact and len(payload) > self.MAX_QR_BYTES:
+            payload = json_dumps(summary)
+
+        level = error_correction.lower() if error_correction.upper() in ("L", "M", "Q", "H") else "m"
+        return self._segno.make_qr(payload, error=level)
+
     # ------------------------------------------------------------------
     def generate(
         self,
@@ -189,46 +270,37 @@ class QRCodeGenerator:
 
         Returns
         -------
-        PIL Image of the QR code, or None if qrcode is unavailable.
+        PIL Image of the QR code, or None if segno is unavailable.
         """
         if not self._available:
             return None
 
-        ec_map = {
-            "L": self._qrcode.constants.ERROR_CORRECT_L,
-            "M": self._qrcode.constants.ERROR_CORRECT_M,
-            "Q": self._qrcode.constants.ERROR_CORRECT_Q,
-            "H": self._qrcode.constants.ERROR_CORRECT_H,
-        }
+        from PIL import Image  # type: ignore
 
-        data_to_encode = (
-            self._compact_summary(encounter_data) if compact else encounter_data
-        )
-        payload = json.dumps(data_to_encode, separators=(",", ":"))
-
-        # Truncate if over QR limit
-        if len(payload.encode("utf-8")) > self.MAX_QR_BYTES:
-            data_to_encode = self._compact_summary(encounter_data)
-            payload = json.dumps(data_to_encode, separators=(",", ":"))
-
-        qr = self._qrcode.QRCode(
-            version=None,
-            error_correction=ec_map.get(error_correction, ec_map["M"]),
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(payload)
-        qr.make(fit=True)
-
-        img = qr.make_image(fill_color="#0D1B2A", back_color="white")
-        return img
+        buf = io.BytesIO(self.generate_bytes(encounter_data, "PNG", compact, error_correction))
+        return Image.open(buf)
 
     # ------------------------------------------------------------------
-    def generate_bytes(self, encounter_data: Dict, fmt: str = "PNG", **kwargs) -> bytes:
-        """Generate a QR code and return it as image bytes."""
-        img = self.generate(encounter_data, **kwargs)
-        if img is None:
+    def generate_bytes(
+        self,
+        encounter_data: Dict,
+        fmt: str = "PNG",
+        compact: bool = True,
+        error_correction: str = "M",
+    ) -> bytes:
+        """
+        Generate a QR code and return it as image bytes, without going through PIL.
+
+        *fmt* is one of :attr:`FORMATS` (case-insensitive); raster formats
+        such as JPEG or BMP are not supported.
+        """
+        if fmt.upper() not in self.FORMATS:
+            raise ValueError(
+                f"Unsupported QR format {fmt!r}; expected one of {', '.join(self.FORMATS)}"
+            )
+        if not self._available:
             return b""
+        qr = self._make(encounter_data, compact, error_correction)
         buf = io.BytesIO()
-        img.save(buf, format=fmt)
+        qr.save(buf, kind=fmt.lower(), scale=10, border=4, dark="#0D1B2A", light="white")
         return buf.getvalue()
@@ -8,16 +8,39 @@ import io
 import re
 import wave
 import struct
+import os
 import logging
 import datetime
+import tempfile
+import threading
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional, Tuple, List
+from typing import BinaryIO, Callable, Deque, Dict, Iterator, Optional, Tuple, List, Union
+
+try:  # optional: linear-time matching for the PII scan
+    import re2  # type: ignore
+except ImportError:
+    re2 = None
+
+try:  # optional: SIMD multi-pattern pre-scan for the PII patterns
+    import hyperscan  # type: ignore
+except ImportError:
+    hyperscan = None
+
+try:
+    import webrtcvad  # type: ignore
+except ImportError:
+    webrtcvad = None
 
 logger = logging.getLogger(__name__)
 
 # ── PII Redaction ──────────────────────────────────────────────────────────────
 
-# Regex patterns for common PII found in clinical speech
+# Regex patterns for common PII found in clinical speech.  The optional
+# groups are all non-capturing, so m.lastgroup in the combined pattern
+# below always names the whole branch.
 _PII_PATTERNS = [
     # Full names: "John Smith", "Dr. Jane Doe"
     (
@@ -56,6 +79,89 @@ _PII_PATTERNS = [
 ]
 
 
+
+def _combine_patterns(patterns) -> str:
+    """One alternation over *patterns*, group ``p<i>`` for the i-th entry."""
+    parts = []
+    for i, (pattern, _label) in enumerate(patterns):
+        body = pattern.pattern
+        if pattern.flags & re.IGNORECASE:
+            body = f"(?i:{body})"  # scope the flag to this branch only
+        parts.append(f"(?P<p{i}>{body})")
+    return "|".join(parts)
+
+
+def _compile_re2(pattern: str):
+    """Compile *pattern* with RE2 (linear-time matching), or return None."""
+    if re2 is None:
+        return None
+    options = re2.Options()
+    options.max_mem = 8 << 20
+    try:
+        return re2.compile(pattern, options)
+    except re2.error as exc:
+        logger.warning("RE2 rejected the PII pattern (%s); using re only.", exc)
+        return None
+
+
+# All patterns in a single scan; on overlaps the earlier pattern wins,
+# matching the order the list above is written in.
+_PII_COMBINED = re.compile(_combine_patterns(_PII_PATTERNS))
+# RE2's \b and \w are ASCII-only, so it is used for ASCII text only;
+# anything else goes through re to keep Unicode word boundaries intact.
+_PII_COMBINED_RE2 = _compile_re2(_PII_COMBINED.pattern)
+_PII_LABEL_ORDER = tuple(label for _, label in _PII_PATTERNS)
+_PII_LABELS = {f"p{i}": label for i, label in enumerate(_PII_LABEL_ORDER)}
+
+def _compile_hyperscan(patterns):
+    """Hyperscan database reporting whether any of *patterns* matches, or None."""
+    if hyperscan is None:
+        return None
+    db = hyperscan.Database(mode=hyperscan.HS_MODE_BLOCK)
+    flags = [
+        hyperscan.HS_FLAG_SINGLEMATCH
+        | (hyperscan.HS_FLAG_CASELESS if pattern.flags & re.IGNORECASE else 0)
+        for pattern, _label in patterns
+    ]
+    try:
+        db.compile(
+            expressions=[pattern.pattern.encode() for pattern, _label in patterns],
+            ids=list(range(len(patterns))),
+            flags=flags,
+        )
+    except hyperscan.error as exc:
+        logger.warning("Hyperscan rejected the PII patterns (%s); skipping it.", exc)
+        return None
+    return db
+
+
+# Hyperscan answers "is there any PII at all?" for ASCII text (its \b and
+# \w match RE2's, not re's Unicode ones); the substitution itself still
+# runs through the combined pattern so overlap resolution is unchanged.
+_PII_HYPERSCAN = _compile_hyperscan(_PII_PATTERNS)
+_hs_local = threading.local()  # scratch space is per thread
+
+
+def _hyperscan_has_pii(text: str) -> bool:
+    scratch = getattr(_hs_local, "scratch", None)
+    if scratch is None:
+        scratch = _hs_local.scratch = hyperscan.Scratch(_PII_HYPERSCAN)
+    try:
+        # Stop at the first hit: the handler's True return aborts the scan
+        _PII_HYPERSCAN.scan(
+            text.encode("ascii"), match_event_handler=lambda *_: True, scratch=scratch
+        )
+    except hyperscan.ScanTerminated:
+        return True
+    return False
+
+
+# Cheap pre-pass: every pattern above needs a digit, an "@", or two adjacent
+# capitalised words, so text without any of these can skip the full scan.
+# Keep this in sync when adding patterns.
+_PII_PREFILTER = re.compile(r"\d|@|[A-Z][a-z][-A-Za-z]*\s+[A-Z][a-z]")
+
+
 def redact_pii(text: str) -> Tuple[str, List[str]]:
     """
     Redact PII from transcribed text using regex patterns.
@@ -63,15 +169,26 @@ def redact_pii(text: str) -> Tuple[str, List[str]]:
     Returns:
         (redacted_text, list_of_redaction_labels)
     """
-    redacted = text
-    labels_found: List[str] = []
-
-    for pattern, label in _PII_PATTERNS:
-        matches = pattern.findall(redacted)
-        if matches:
-            labels_found.append(label)
-        redacted = pattern.sub(label, redacted)
-
+    if _PII_HYPERSCAN is not None and text.isascii():
+        if not _hyperscan_has_pii(text):
+            return text, []
+    elif not _PII_PREFILTER.search(text):
+        return text, []
+
+    found = set()
+
+    def _sub(m) -> str:
+        label = _PII_LABELS[m.lastgroup]
+        found.add(label)
+        return label
+
+    combined = _PII_COMBINED
+    if _PII_COMBINED_RE2 is not None and text.isascii():
+        combined = _PII_COMBINED_RE2
+    redacted, n = combined.subn(_sub, text)
+    if not n:
+        return text, []
+    labels_found = [label for label in _PII_LABEL_ORDER if label in found]
     return redacted, labels_found
 
 
@@ -83,59 +200,104 @@ FRAME_SIZE = int(SAMPLE_RATE * FRAME_DURATION_MS / 1000)  # samples per frame
 VAD_AGGRESSIVENESS = 2  # 0–3; higher = more aggressive speech filtering
 
 
+# Canonical 44-byte RIFF/WAVE header for uncompressed PCM
+_WAV_HEADER = struct.Struct("<4sI4s4sIHHIIHH4sI")
+
+
 def bytes_to_wav(pcm_bytes: bytes, sample_rate: int = SAMPLE_RATE) -> bytes:
     """Wrap raw 16-bit mono PCM bytes in a WAV container."""
-    buf = io.BytesIO()
-    with wave.open(buf, "wb") as wf:
-        wf.setnchannels(1)
-        wf.setsampwidth(2)  # 16-bit
-        wf.setframerate(sample_rate)
-        wf.writeframes(pcm_bytes)
-    return buf.getvalue()
+    size = len(pcm_bytes)
+    header = _WAV_HEADER.pack(
+        b"RIFF", 36 + size, b"WAVE",
+        b"fmt ", 16, 1, 1,  # PCM, mono
+        sample_rate, sample_rate * 2, 2, 16,  # byte rate, block align, 16-bit
+        b"data", size,
+    )
+    return b"".join((header, pcm_bytes))
+
+
+def iter_pcm_frames(pcm_bytes: bytes, frame_size: int = FRAME_SIZE) -> Iterator[memoryview]:
+    """Lazily yield zero-copy frames of *frame_size* samples from *pcm_bytes*."""
+    frame_bytes = frame_size * 2  # 16-bit → 2 bytes per sample
+    view = memoryview(pcm_bytes).cast("B")
+    for i in range(0, len(view) - frame_bytes + 1, frame_bytes):
+        yield view[i : i + frame_bytes]
 
 
-def pcm_frames(pcm_bytes: bytes, frame_size: int = FRAME_SIZE) -> List[bytes]:
-    """Split raw PCM bytes into frames of *frame_size* samples (2 bytes each)."""
-    frame_bytes = frame_size * 2  # 16-bit → 2 bytes per sample
-    return [
-        pcm_bytes[i : i + frame_bytes]
-        for i in range(0, len(pcm_bytes) - frame_bytes + 1, frame_bytes)
-    ]
+def pcm_frames(pcm_bytes: bytes, frame_size: int = FRAME_SIZE) -> List[memoryview]:
+    """
+    Split raw PCM bytes into frames of *frame_size* samples (2 bytes each).
+
+    Frames are zero-copy views into *pcm_bytes*; call ``bytes(frame)`` if a
+    frame has to outlive the buffer.
+    """
+    return list(iter_pcm_frames(pcm_bytes, frame_size))
 
 
 # ── Voice Activity Detection ───────────────────────────────────────────────────
 
 
+# Silero speech-probability threshold for each aggressiveness level (0–3)
+_SILERO_THRESHOLDS = (0.3, 0.4, 0.5, 0.6)
+_SILERO_RATES = {8000: 256, 16000: 512}  # sample rate → samples per window
+
+
+def _load_silero():
+    """Silero VAD on ONNX Runtime, or None when ``silero-vad`` isn't usable."""
+    try:
+        from silero_vad import load_silero_vad  # type: ignore
+    except ImportError:
+        return None
+    try:
+        return load_silero_vad(onnx=True)
+    except Exception as exc:
+        logger.warning("Silero VAD failed to load (%s); using webrtcvad.", exc)
+        return None
+
+
 class VoiceActivityDetector:
     """
-    Wraps webrtcvad to filter silent frames from audio recordings.
-    Falls back gracefully when webrtcvad is not installed.
-    """
+    Filters silent frames from audio recordings.
 
-    def __init__(self, aggressiveness: int = VAD_AGGRESSIVENESS):
-        self._available = False
-        try:
-            import webrtcvad  # type: ignore
+    Prefers the Silero neural VAD (``silero-vad``), which scores a whole
+    recording in one call and is more accurate than webrtcvad, then falls
+    back to webrtcvad, and degrades gracefully when neither is installed.
+    """
 
+    def __init__(self, aggressiveness: int = VAD_AGGRESSIVENESS, backend: str = "auto"):
+        """``backend`` is ``"auto"``, ``"silero"`` or ``"webrtcvad"``."""
+        self._vad = None
+        self._silero = None
+        self._silero_lock = threading.Lock()  # the model carries recurrent state
+        self._threshold = _SILERO_THRESHOLDS[max(0, min(aggressiveness, 3))]
+        if backend in ("auto", "silero"):
+            self._silero = _load_silero()
+        if backend in ("auto", "webrtcvad") and webrtcvad is not None:
             self._vad = webrtcvad.Vad(aggressiveness)
-            self._available = True
+        self._available = self._silero is not None or self._vad is not None
+
+        if self._silero is not None:
+            logger.info("Silero VAD loaded (threshold=%.1f)", self._threshold)
+        elif self._vad is not None:
             logger.info("webrtcvad loaded (aggressiveness=%d)", aggressiveness)
-        except ImportError:
+        else:
             logger.warning(
-                "webrtcvad not installed – VAD disabled. "
-                "Install with: pip install webrtcvad"
+                "No VAD backend installed – VAD disabled. "
+                "Install with: pip install silero-vad onnxruntime (or webrtcvad)"
             )
 
     @property
     def available(self) -> bool:
         return self._available
 
-    def is_speech(self, frame: bytes, sample_rate: int = SAMPLE_RATE) -> bool:
+    def is_speech(self, frame: Union[bytes, memoryview], sample_rate: int = SAMPLE_RATE) -> bool:
         """Return True if *frame* contains speech."""
         if not self._available:
             return True  # assume speech when VAD unavailable
         try:
-            return self._vad.is_speech(frame, sample_rate)
+            if self._vad is not None:
+                return self._vad.is_speech(frame, sample_rate)
+            return self._silero_frame_prob(frame, sample_rate) >= self._threshold
         except Exception:
             return True
 
@@ -146,9 +308,150 @@ class VoiceActivityDetector:
         sample_rate: int = SAMPLE_RATE,
     ) -> bytes:
         """Return only speech frames concatenated together."""
-        frames = pcm_frames(pcm_bytes, frame_size)
-        speech_frames = [f for f in frames if self.is_speech(f, sample_rate)]
-        return b"".join(speech_frames)
+        if self._silero is not None and sample_rate in _SILERO_RATES:
+            try:
+                return self._filter_silero(pcm_bytes, sample_rate)
+            except Exception as exc:
+                logger.warning("Silero VAD failed (%s); falling back.", exc)
+
+        # Whole frames only, as pcm_frames would split them; slicing the full
+        # length returns pcm_bytes itself, so "keep everything" copies nothing.
+        whole = len(pcm_bytes) - len(pcm_bytes) % (frame_size * 2)
+        if self._vad is None:
+            return pcm_bytes[:whole]
+        # Bound method + locals keep the per-frame cost down; a bad frame
+        # size or sample rate fails on the first frame, so guard once.
+        is_speech = self._vad.is_speech
+        sr = sample_rate
+        # Frames are generated on the fly; only the speech ones are kept
+        frames = iter_pcm_frames(pcm_bytes, frame_size)
+        try:
+            return b"".join([f for f in frames if is_speech(f, sr)])
+        except Exception as exc:
+            logger.warning("VAD failed (%s); keeping all frames.", exc)
+            return pcm_bytes[:whole]
+
+    def speech_segments(
+        self,
+        pcm_bytes: bytes,
+        min_silence_ms: int = 500,
+        max_segment_s: float = 30.0,
+        frame_size: int = FRAME_SIZE,
+        sample_rate: int = SAMPLE_RATE,
+    ) -> List[bytes]:
+        """
+        Split a recording at pauses of at least *min_silence_ms*, dropping
+        the silence between segments; no segment exceeds *max_segment_s*.
+        Shorter pauses stay inside their segment.
+        """
+        frame_bytes = frame_size * 2
+        max_frames = max(1, int(max_segment_s * sample_rate) // frame_size)
+        max_bytes = max_frames * frame_bytes
+        fixed = [pcm_bytes[i : i + max_bytes] for i in range(0, len(pcm_bytes), max_bytes)]
+
+        if self._silero is not None and sample_rate in _SILERO_RATES:
+            try:
+                view = memoryview(pcm_bytes)
+                return [
+                    bytes(view[start:end])
+                    for start, end in self._silero_spans(
+                        pcm_bytes,
+                        sample_rate,
+                        min_silence_duration_ms=min_silence_ms,
+                        max_speech_duration_s=max_segment_s,
+                    )
+                ]
+            except Exception as exc:
+                logger.warning("Silero VAD failed (%s); falling back.", exc)
+        if self._vad is None:
+            return fixed
+
+        max_silent = max(1, min_silence_ms * sample_rate // (1000 * frame_size))
+        is_speech = self._vad.is_speech
+        segments: List[bytes] = []
+        current: List[memoryview] = []
+        size = 0
+        silent = 0  # trailing non-speech frames in current
+
+        def _flush() -> None:
+            nonlocal current, size, silent
+            speech = current[: len(current) - silent]
+            if speech:
+                segments.append(b"".join(speech))
+            current, size, silent = [], 0, 0
+
+        try:
+            for frame in iter_pcm_frames(pcm_bytes, frame_size):
+                if is_speech(frame, sample_rate):
+                    silent = 0
+                elif not current:
+                    continue
+                else:
+                    silent += 1
+                current.append(frame)
+                size += frame_bytes
+                if silent >= max_silent or size >= max_bytes:
+                    _flush()
+        except Exception as exc:
+            logger.warning("VAD failed (%s); splitting at fixed lengths.", exc)
+            return fixed
+        _flush()
+        return segments
+
+    # ------------------------------------------------------------------
+    def _filter_silero(self, pcm_bytes: bytes, sample_rate: int) -> bytes:
+        """Keep the speech segments Silero finds in one pass over the recording."""
+        view = memoryview(pcm_bytes)
+        return b"".join(
+            view[start:end] for start, end in self._silero_spans(pcm_bytes, sample_rate)
+        )
+
+    def _silero_spans(
+        self, pcm_bytes: bytes, sample_rate: int, **kwargs
+    ) -> List[Tuple[int, int]]:
+        """Byte ``(start, end)`` offsets of Silero's speech timestamps."""
+        import numpy as np
+        import torch  # type: ignore
+        from silero_vad import get_speech_timestamps  # type: ignore
+
+        samples = np.frombuffer(pcm_bytes, dtype=np.int16, count=len(pcm_bytes) // 2)
+        audio = torch.from_numpy(samples.astype(np.float32) / 32768.0)
+        with self._silero_lock:
+            spans = get_speech_timestamps(
+                audio,
+                self._silero,
+                threshold=self._threshold,
+                sampling_rate=sample_rate,
+                **kwargs,
+            )
+        return [(s["start"] * 2, s["end"] * 2) for s in spans]
+
+    def _silero_frame_prob(self, frame: Union[bytes, memoryview], sample_rate: int) -> float:
+        """Speech probability for one frame, zero-padded to Silero's window size."""
+        import numpy as np
+        import torch  # type: ignore
+
+        window = _SILERO_RATES[sample_rate]
+        samples = np.frombuffer(frame, dtype=np.int16)[:window]
+        chunk = np.zeros(window, dtype=np.float32)
+        chunk[: len(samples)] = samples / 32768.0
+        with self._silero_lock:
+            return self._silero(torch.from_numpy(chunk), sample_rate).item()
+
+
+_VAD_CACHE: Dict[int, VoiceActivityDetector] = {}
+
+
+def get_vad(aggressiveness: int = VAD_AGGRESSIVENESS) -> VoiceActivityDetector:
+    """Shared :class:`VoiceActivityDetector`, one per aggressiveness level."""
+    vad = _VAD_CACHE.get(aggressiveness)
+    if vad is None:
+        vad = _VAD_CACHE.setdefault(aggressiveness, VoiceActivityDetector(aggressiveness))
+    return vad
+
+
+# Audio bytes per streaming_recognize request (~0.3 s of 16 kHz PCM)
+_MEDASR_CHUNK_BYTES = 10 * 1024
 
 
 # ── MedASR Transcription ───────────────────────────────────────────────────────
@@ -166,6 +469,16 @@ class MedASRClient:
         self._api_key = api_key
         self._use_local_fallback = use_local_fallback
         self._local_model = None  # lazy-loaded Whisper model
+        self._faster_whisper = False  # True when _local_model is faster-whisper
+        self._whisper_fp16 = False  # OpenAI Whisper on CUDA decodes in fp16
+        self._speech_client = None  # lazy google.cloud.speech.SpeechClient
+        self._speech_client_lock = threading.Lock()
+        # Scratch WAV for Whisper inputs that must go through ffmpeg; created
+        # on first use with mkstemp (owner-only, O_EXCL) and emptied after use
+        self._whisper_tmp: Optional[BinaryIO] = None
+        self._whisper_tmp_path = ""
+        self._whisper_tmp_lock = threading.Lock()
+        self.last_result: dict = {"text": "", "confidence": 0.0, "source": "none"}
 
     # ------------------------------------------------------------------
     def transcribe(
@@ -194,6 +507,109 @@ class MedASRClient:
             except Exception as exc:
                 logger.warning("MedASR API failed (%s); falling back to Whisper.", exc)
 
+        return self._transcribe_fallback(audio_bytes)
+
+    # ------------------------------------------------------------------
+    def transcribe_batch(
+        self, audio_list: List[bytes], language: str = "en-US"
+    ) -> List[dict]:
+        """
+        Transcribe several clips, returning one :meth:`transcribe` dict each.
+
+        MedASR requests are sent concurrently; clips it fails on fall back
+        to local Whisper one at a time.
+        """
+        results: List[Optional[dict]] = [None] * len(audio_list)
+        if self._api_key and audio_list:
+            with ThreadPoolExecutor(max_workers=min(8, len(audio_list))) as pool:
+                futures = [
+                    pool.submit(self._transcribe_medasr, audio, language)
+                    for audio in audio_list
+                ]
+            for i, future in enumerate(futures):
+                try:
+                    results[i] = future.result()
+                except Exception as exc:
+                    logger.warning("MedASR API failed (%s); falling back to Whisper.", exc)
+
+        return [
+            result if result is not None else self._transcribe_fallback(audio)
+            for audio, result in zip(audio_list, results)
+        ]
+
+    # ------------------------------------------------------------------
+    def transcribe_long(
+        self,
+        audio_bytes: bytes,
+        language: str = "en-US",
+        max_chunk_s: float = 30.0,
+        vad: Optional[VoiceActivityDetector] = None,
+    ) -> dict:
+        """
+        Transcribe a long recording by splitting it at pauses of 500 ms or
+        more (pieces of at most *max_chunk_s*) and transcribing the pieces
+        concurrently through :meth:`transcribe_batch`.
+
+        Returns the same dict shape as :meth:`transcribe`, with the text
+        reassembled in recording order.
+        """
+        pcm = audio_bytes
+        if audio_bytes[:4] == b"RIFF":
+            wav = _read_wav(audio_bytes)
+            if wav is None or wav[1:] != (1, 2, SAMPLE_RATE):
+                return self.transcribe(audio_bytes, language)
+            pcm = wav[0]
+
+        chunks = (vad or get_vad()).speech_segments(pcm, max_segment_s=max_chunk_s)
+        results = [r for r in self.transcribe_batch(chunks, language) if r["text"]]
+        if not results:
+            return {"text": "", "confidence": 0.0, "source": "none"}
+        return {
+            "text": " ".join(r["text"] for r in results),
+            "confidence": sum(r["confidence"] for r in results) / len(results),
+            "source": results[0]["source"],
+        }
+
+    # ------------------------------------------------------------------
+    def transcribe_stream(
+        self, audio_bytes: bytes, language: str = "en-US"
+    ) -> Iterator[str]:
+        """
+        Transcribe audio, yielding text as each recognised segment arrives.
+
+        MedASR results are yielded segment by segment; the local Whisper
+        fallback yields its whole transcript at once.  Once the iterator is
+        exhausted, :attr:`last_result` holds the same dict :meth:`transcribe`
+        would have returned.
+        """
+        if self._api_key:
+            try:
+                results = self._recognize_medasr(audio_bytes, language)
+            except Exception as exc:
+                logger.warning("MedASR API failed (%s); falling back to Whisper.", exc)
+            else:
+                texts: List[str] = []
+                confidences: List[float] = []
+                for res in results:
+                    alt = res.alternatives[0]
+                    text = alt.transcript.strip()
+                    if text:
+                        texts.append(text)
+                        confidences.append(alt.confidence)
+                        yield text + " "
+                self.last_result = {
+                    "text": " ".join(texts),
+                    "confidence": sum(confidences) / len(confidences) if confidences else 0.0,
+                    "source": "medasr",
+                }
+                return
+
+        self.last_result = self._transcribe_fallback(audio_bytes)
+        if self.last_result["text"]:
+            yield self.last_result["text"]
+
+    # ------------------------------------------------------------------
+    def _transcribe_fallback(self, audio_bytes: bytes) -> dict:
         if self._use_local_fallback:
             try:
                 return self._transcribe_whisper(audio_bytes)
@@ -205,32 +621,12 @@ class MedASRClient:
     # ------------------------------------------------------------------
     def _transcribe_medasr(self, audio_bytes: bytes, language: str) -> dict:
         """Call Google Cloud Speech-to-Text v2 / MedASR endpoint."""
-        from google.cloud import speech  # type: ignore
-
-        client = speech.SpeechClient(
-            client_options={"api_key": self._api_key} if self._api_key else {}
-        )
-
-        # Ensure WAV wrapper
-        if not audio_bytes[:4] == b"RIFF":
-            audio_bytes = bytes_to_wav(audio_bytes)
-
-        audio = speech.RecognitionAudio(content=audio_bytes)
-        config = speech.RecognitionConfig(
-            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
-            sample_rate_hertz=SAMPLE_RATE,
-            language_code=language,
-            model="medical_dictation",  # MedASR model selector
-            enable_automatic_punctuation=True,
-            use_enhanced=True,
-        )
-
-        response = client.recognize(config=config, audio=audio)
-        if not response.results:
+        results = self._recognize_medasr(audio_bytes, language)
+        if not results:
             return {"text": "", "confidence": 0.0, "source": "medasr"}
 
         best = max(
-            response.results, key=lambda r: r.alternatives[0].confidence
+            results, key=lambda r: r.alternatives[0].confidence
         )
         alt = best.alternatives[0]
         return {
@@ -240,31 +636,199 @@ class MedASRClient:
         }
 
     # ------------------------------------------------------------------
-    def _transcribe_whisper(self, audio_bytes: bytes) -> dict:
-        """Transcribe with OpenAI Whisper (runs locally, no internet needed)."""
-        import tempfile
-        import whisper  # type: ignore
+    def _get_speech_client(self):
+        """
+        The Speech client, created once per MedASRClient so the TLS handshake
+        and gRPC channel setup are paid on the first request only.
+        """
+        if self._speech_client is None:
+            from google.cloud import speech  # type: ignore
 
-        if self._local_model is None:
-            logger.info("Loading Whisper model (first call may be slow)…")
-            self._local_model = whisper.load_model("base.en")
+            with self._speech_client_lock:  # transcribe_batch calls in from threads
+                if self._speech_client is None:
+                    self._speech_client = speech.SpeechClient(
+                        client_options={"api_key": self._api_key} if self._api_key else {}
+                    )
+        return self._speech_client
 
-        # Write to a temp WAV file because Whisper expects a file path
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp:
-            wav_data = bytes_to_wav(audio_bytes) if audio_bytes[:4] != b"RIFF" else audio_bytes
-            tmp.write(wav_data)
-            tmp_path = tmp.name
+    # ------------------------------------------------------------------
+    def _recognize_medasr(self, audio_bytes: bytes, language: str) -> list:
+        """
+        Stream *audio_bytes* to MedASR and return its final results.
 
-        result = self._local_model.transcribe(tmp_path, language="en", fp16=False)
-        Path(tmp_path).unlink(missing_ok=True)
+        The audio goes up in small chunks over ``streaming_recognize``, so
+        recognition runs while the upload is still in progress.
+        """
+        from google.cloud import speech  # type: ignore
+
+        client = self._get_speech_client()
+
+        # Streaming takes bare LINEAR16 samples, not a WAV container
+        pcm, channels, sample_rate = audio_bytes, 1, SAMPLE_RATE
+        if audio_bytes[:4] == b"RIFF":
+            wav = _read_wav(audio_bytes)
+            if wav is not None:
+                pcm, channels, _width, sample_rate = wav
+
+        config = speech.StreamingRecognitionConfig(
+            config=speech.RecognitionConfig(
+                encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+                sample_rate_hertz=sample_rate,
+                audio_channel_count=channels,
+                language_code=language,
+                model="medical_dictation",  # MedASR model selector
+                enable_automatic_punctuation=True,
+                use_enhanced=True,
+            ),
+        )
+        view = memoryview(pcm)
+        requests = (
+            speech.StreamingRecognizeRequest(
+                audio_content=bytes(view[i : i + _MEDASR_CHUNK_BYTES])
+            )
+            for i in range(0, len(view), _MEDASR_CHUNK_BYTES)
+        )
+        return [
+            result
+            for response in client.streaming_recognize(config=config, requests=requests)
+            for result in response.results
+            if result.is_final
+        ]
+
+    # ------------------------------------------------------------------
+    def _load_whisper(self) -> None:
+        """Load faster-whisper (CTranslate2) if installed, else OpenAI Whisper."""
+        if self._local_model is not None:
+            return
+        logger.info("Loading Whisper model (first call may be slow)…")
+        try:
+            import ctranslate2  # type: ignore
+            from faster_whisper import WhisperModel  # type: ignore
+        except ImportError:
+            import torch  # type: ignore
+            import whisper  # type: ignore
+
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+            self._local_model = whisper.load_model("base.en", device=device)
+            self._whisper_fp16 = device == "cuda"
+            self._faster_whisper = False
+            return
+        if ctranslate2.get_cuda_device_count() > 0:
+            self._local_model = WhisperModel(
+                "base.en", device="cuda", compute_type="int8_float16"
+            )
+        else:
+            # int8 GEMMs (VNNI/AVX2) on every core; one worker keeps latency low
+            self._local_model = WhisperModel(
+                "base.en",
+                device="cpu",
+                compute_type="int8",
+                cpu_threads=os.cpu_count() or 0,
+                num_workers=1,
+            )
+        self._faster_whisper = True
+
+    # ------------------------------------------------------------------
+    def _transcribe_whisper(self, audio_bytes: bytes) -> dict:
+        """Transcribe with Whisper (runs locally, no internet needed)."""
+        self._load_whisper()
+        samples = _whisper_samples(audio_bytes)
+
+        if self._faster_whisper:
+            # PyAV decodes other WAV layouts in-process; silence gating is
+            # left to VoiceActivityDetector, so the built-in VAD stays off
+            segments, _info = self._local_model.transcribe(
+                samples if samples is not None else io.BytesIO(audio_bytes),
+                language="en",
+                beam_size=1,
+                vad_filter=False,
+            )
+            text = "".join(seg.text for seg in segments)
+        elif samples is not None:
+            # 16 kHz mono: hand Whisper the samples, no temp file or ffmpeg
+            result = self._local_model.transcribe(
+                samples, language="en", fp16=self._whisper_fp16
+            )
+            text = result.get("text", "")
+        else:
+            # Other WAV layouts need ffmpeg's resampling, which wants a file
+            # path: overwrite this client's scratch file rather than a new one
+            with self._whisper_tmp_lock:
+                if self._whisper_tmp is None:
+                    fd, self._whisper_tmp_path = tempfile.mkstemp(
+                        prefix="medasr_", suffix=".wav", dir=_scratch_dir()
+                    )
+                    self._whisper_tmp = os.fdopen(fd, "w+b")
+                    weakref.finalize(
+                        self, _close_scratch, self._whisper_tmp, self._whisper_tmp_path
+                    )
+                tmp = self._whisper_tmp
+                tmp.seek(0)
+                tmp.truncate()
+                tmp.write(audio_bytes)
+                tmp.flush()
+                try:
+                    result = self._local_model.transcribe(
+                        self._whisper_tmp_path, language="en", fp16=self._whisper_fp16
+                    )
+                finally:
+                    # Don't leave patient audio lying around between calls
+                    tmp.truncate(0)
+            text = result.get("text", "")
 
         return {
-            "text": result.get("text", "").strip(),
+            "text": text.strip(),
             "confidence": 0.85,  # Whisper doesn't return per-utterance confidence
             "source": "whisper",
         }
 
 
+def _close_scratch(tmp: BinaryIO, path: str) -> None:
+    """Close and remove a :class:`MedASRClient` Whisper scratch file."""
+    tmp.close()
+    Path(path).unlink(missing_ok=True)
+
+
+def _scratch_dir() -> Path:
+    """RAM-backed /dev/shm where available, else the system temp directory."""
+    shm = Path("/dev/shm")
+    if shm.is_dir() and os.access(shm, os.W_OK):
+        return shm
+    return Path(tempfile.gettempdir())
+
+
+def _read_wav(audio_bytes: bytes) -> Optional[Tuple[bytes, int, int, int]]:
+    """``(pcm, channels, sample_width, sample_rate)`` of a WAV, or None if unreadable."""
+    try:
+        with wave.open(io.BytesIO(audio_bytes), "rb") as wf:
+            return (
+                wf.readframes(wf.getnframes()),
+                wf.getnchannels(),
+                wf.getsampwidth(),
+                wf.getframerate(),
+            )
+    except (wave.Error, EOFError):
+        return None
+
+
+def _whisper_samples(audio_bytes: bytes):
+    """
+    Decode 16 kHz mono 16-bit audio (raw PCM or WAV) to the float32 array
+    Whisper accepts directly; None for WAVs in any other layout.
+    """
+    import numpy as np
+
+    if audio_bytes[:4] == b"RIFF":
+        wav = _read_wav(audio_bytes)
+        if wav is None or wav[1:] != (1, 2, SAMPLE_RATE):
+            return None
+        pcm = wav[0]
+    else:
+        pcm = audio_bytes
+    samples = np.frombuffer(pcm, dtype=np.int16, count=len(pcm) // 2)
+    return samples.astype(np.float32) / 32768.0
+
+
 # ── Audio Recorder ─────────────────────────────────────────────────────────────
 
 
@@ -281,15 +845,139 @@ class AudioRecorder:
         vad: Optional[VoiceActivityDetector] = None,
     ):
         self._sample_rate = sample_rate
-        self._vad = vad or VoiceActivityDetector()
+        self._vad = vad or get_vad()
         self._frames: List[bytes] = []
         self._recording = False
+        # Background capture (start/stop): the audio callback queues each frame
+        # (VAD-gated when that is cheap); a consumer thread assembles utterances.
+        self._stream = None
+        self._consumer: Optional[threading.Thread] = None
+        self._queue: Deque[Tuple[bytes, Optional[bool]]] = deque()
+        self._wake = threading.Event()
 
     # ------------------------------------------------------------------
     @property
     def is_recording(self) -> bool:
         return self._recording
 
+    # ------------------------------------------------------------------
+    def start(
+        self,
+        on_utterance: Optional[Callable[[bytes], None]] = None,
+        silence_ms: int = 600,
+    ) -> bool:
+        """
+        Start recording in the background, one VAD frame at a time.
+
+        *on_utterance* is called from a worker thread with the speech PCM of
+        each utterance once *silence_ms* of silence follows it (e.g. to
+        hand it to :meth:`MedASRClient.transcribe`).  Returns False when
+        sounddevice is unavailable.
+        """
+        if self._recording:
+            return True
+        try:
+            import sounddevice as sd  # type: ignore
+        except ImportError:
+            logger.error(
+                "sounddevice not installed. Install with: pip install sounddevice"
+            )
+            return False
+
+        vad = self._vad if self._vad.available else None
+        sample_rate = self._sample_rate
+        queue, wake = self._queue, self._wake
+        # webrtcvad is cheap and lock-free, so it can run on the audio thread.
+        # Silero shares a lock with filter_speech; classify in the consumer.
+        inline_vad = vad if vad is not None and vad._silero is None else None
+
+        def _callback(indata, frames, time_info, status) -> None:
+            # Runs on the audio thread: classify and hand off, nothing more
+            frame = bytes(indata)
+            queue.append((frame, inline_vad.is_speech(frame, sample_rate) if inline_vad else None))
+            wake.set()
+
+        self._frames = []
+        queue.clear()
+        stream = None
+        try:
+            stream = sd.RawInputStream(
+                samplerate=sample_rate,
+                blocksize=int(sample_rate * FRAME_DURATION_MS / 1000),
+                dtype="int16",
+                channels=1,
+                callback=_callback,
+            )
+            stream.start()
+        except Exception as exc:
+            logger.error("Recording failed: %s", exc)
+            if stream is not None:
+                stream.close()
+            return False
+        self._stream = stream
+        self._recording = True
+        self._consumer = threading.Thread(
+            target=self._consume,
+            args=(on_utterance, silence_ms, vad),
+            name="medecho-recorder",
+            daemon=True,
+        )
+        self._consumer.start()
+        return True
+
+    # ------------------------------------------------------------------
+    def stop(self) -> bytes:
+        """Stop a :meth:`start` recording and return all speech PCM captured."""
+        if self._recording:
+            self._stream.stop()
+            self._stream.close()
+            self._stream = None
+            self._recording = False
+            self._wake.set()
+            self._consumer.join()
+            self._consumer = None
+        return b"".join(self._frames)
+
+    # ------------------------------------------------------------------
+    def _consume(
+        self,
+        on_utterance: Optional[Callable[[bytes], None]],
+        silence_ms: int,
+        vad: Optional[VoiceActivityDetector],
+    ) -> None:
+        """Drain the frame queue, emitting an utterance after enough silence."""
+        max_silent = max(1, silence_ms // FRAME_DURATION_MS)
+        utterance: List[bytes] = []
+        silent = 0
+
+        def _emit() -> None:
+            if on_utterance is None:
+                return
+            try:
+                on_utterance(b"".join(utterance))
+            except Exception as exc:
+                logger.error("Utterance callback failed: %s", exc)
+
+        while self._recording or self._queue:
+            self._wake.wait(0.1)
+            self._wake.clear()
+            while self._queue:
+                frame, speech = self._queue.popleft()
+                if speech is None:
+                    speech = vad.is_speech(frame, self._sample_rate) if vad else True
+                if speech:
+                    self._frames.append(frame)
+                    utterance.append(frame)
+                    silent = 0
+                elif utterance:
+                    silent += 1
+                    if silent >= max_silent:
+                        _emit()
+                        utterance = []
+                        silent = 0
+        if utterance:
+            _emit()
+
     # ------------------------------------------------------------------
     def record_chunk(self, duration_s: float = 2.0) -> bytes:
         """
@@ -307,7 +995,8 @@ class AudioRecorder:
                 dtype="int16",
                 blocking=True,
             )
-            pcm = audio.flatten().astype("int16").tobytes()
+            # Already int16 and C-contiguous (N, 1): one copy straight out
+            pcm = np.ascontiguousarray(audio, dtype=np.int16).tobytes()
             return self._vad.filter_speech(pcm) if self._vad.available else pcm
         except ImportError:
             logger.error(